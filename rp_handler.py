@@ -4,154 +4,633 @@
 RunPod handler for ComfyUI and VibeVoice integration.
 """
 
-import json
+import binascii
+import concurrent.futures
+import functools
+import hashlib
+import mmap
 import os
-import base64
+import queue
+import shutil
+import struct
 import tempfile
+import threading
+import time
+import uuid
 import requests
-from typing import Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Any, Literal, Optional, Tuple
 import asyncio
+import contextlib
 import websockets
-from pydantic import BaseModel, Field
+import orjson
+from pathlib import Path
+from pydantic import BaseModel, ConfigDict, Field
+
+try:
+    # SIMD-accelerated codec exposing the same API as the stdlib module
+    import pybase64 as base64
+    # Strict decoding rejects non-alphabet characters and skips the filtering pass
+    _b64decode = functools.partial(base64.b64decode, validate=True)
+    # Encodes straight into a str, with no intermediate bytes object
+    _b64encode_str = base64.b64encode_as_string
+except ImportError:
+    import base64
+    # The C routine behind base64.b64decode, without its argument munging
+    _b64decode = binascii.a2b_base64
+
+    def _b64encode_str(data) -> str:
+        return binascii.b2a_base64(data, newline=False).decode("ascii")
+
+try:
+    # Header-only reader for containers other than RIFF/WAVE
+    import soundfile as sf
+except ImportError:
+    sf = None
 
 class TTSRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=False, validate_default=False)
+
     text: str = Field(..., min_length=1, max_length=1000)
     reference_audio: Optional[str] = None
     temperature: float = Field(0.8, ge=0.0, le=2.0)
     speed: float = Field(1.0, ge=0.5, le=2.0)
     seed: int = Field(42, ge=0, le=1000000)
+    return_mode: Literal["base64", "url"] = "base64"
 
-def process_reference_audio(ref_audio: Optional[str]) -> str:
-    """Process reference audio: handle base64, URL, or use default."""
-    if not ref_audio:
-        default_path = "input/maya.wav"
-        if os.path.exists(default_path):
-            return default_path
-        else:
-            # Download default if not present
-            response = requests.get("https://example.com/maya.wav")  # Replace with actual URL
-            with open(default_path, "wb") as f:
-                f.write(response.content)
-            return default_path
-
-    if ref_audio.startswith("http"):
-        # Download from URL
-        response = requests.get(ref_audio)
+# Base64 reference audio is decoded in slices of this many characters (a
+# multiple of 4) so peak memory stays bounded regardless of the payload size.
+B64_DECODE_CHUNK_CHARS = 4 * 65536
+# Buffer size used when streaming downloaded audio to disk
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+# (connect, read) timeouts in seconds for audio downloads
+HTTP_TIMEOUT = (3, 30)
+
+# Shared session so warm workers reuse keep-alive connections and DNS lookups
+_SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.3),
+)
+_SESSION.mount("http://", _adapter)
+_SESSION.mount("https://", _adapter)
+
+# Optional on-disk LRU of reference audio keyed by a hash of the request value,
+# so repeated voices skip the decode/download. Disabled unless the directory
+# is configured. URL entries are keyed by the URL alone and never expire, so
+# a URL whose content changes keeps serving the first download until evicted.
+_REF_CACHE_DIR = Path(os.environ["REF_AUDIO_CACHE_DIR"]) if os.environ.get("REF_AUDIO_CACHE_DIR") else None
+REF_CACHE_MAX_ENTRIES = int(os.environ.get("REF_AUDIO_CACHE_MAX_ENTRIES", 256))
+# Per-request reference audio goes to tmpfs when available, so the write and
+# ComfyUI's read never touch the disk
+REF_AUDIO_TMP_DIR = os.environ.get("REF_AUDIO_TMP_DIR") or (
+    "/dev/shm" if os.path.isdir("/dev/shm") else None
+)
+# Cache misses being filled, by key; concurrent jobs asking for the same voice
+# wait on the one fetch instead of repeating the download or decode.
+_ref_inflight: Dict[str, concurrent.futures.Future] = {}
+_ref_inflight_lock = threading.Lock()
+# Number of files in the cache directory, counted on the first fill and kept
+# up to date afterwards so the directory is only scanned to evict
+_ref_cache_count: Optional[int] = None
+_ref_cache_lock = threading.Lock()
+
+def _decode_base64_to_file(data: str, f) -> None:
+    """Decode base64 data into an open binary file, one slice at a time."""
+    # Drop line wrapping (MIME-style base64) so every slice stays 4-aligned;
+    # unwrapped input comes back as the same object, without a copy
+    data = "".join(data.split())
+    for start in range(0, len(data), B64_DECODE_CHUNK_CHARS):
+        f.write(_b64decode(data[start:start + B64_DECODE_CHUNK_CHARS]))
+
+def _download_to_file(url: str, f) -> None:
+    """Stream a URL's body into an open binary file."""
+    with _SESSION.get(url, stream=True, timeout=HTTP_TIMEOUT) as response:
         response.raise_for_status()
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
-            f.write(response.content)
-            return f.name
+        # Undo any Content-Encoding (gzip, deflate) while copying
+        response.raw.decode_content = True
+        shutil.copyfileobj(response.raw, f, DOWNLOAD_CHUNK_SIZE)
+
+def _write_reference_audio(ref_audio: str, f) -> None:
+    """Write URL or base64 reference audio into an open binary file."""
+    # ":" is outside the base64 alphabet, so the scheme alone tells them apart
+    if ref_audio.startswith(("http://", "https://")):
+        # Download from URL, streaming the body straight to disk
+        _download_to_file(ref_audio, f)
     else:
         # Assume base64
         try:
-            audio_data = base64.b64decode(ref_audio)
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
-                f.write(audio_data)
-                return f.name
+            _decode_base64_to_file(ref_audio, f)
+        except ValueError as e:
+            # binascii.Error and non-ASCII input both land here; I/O errors do not
+            raise ValueError("Invalid base64 reference audio") from e
+
+def _scan_reference_cache() -> list:
+    """Return (mtime, path) for every cached file, oldest first."""
+    entries = []
+    for entry in os.scandir(_REF_CACHE_DIR):
+        if entry.name.endswith(".wav"):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+    entries.sort()
+    return entries
+
+def _sweep_reference_cache() -> int:
+    """Evict the least recently used cache entries over the size limit.
+
+    Returns the number of entries left in the cache.
+    """
+    entries = _scan_reference_cache()
+    for _, path in entries[:-REF_CACHE_MAX_ENTRIES]:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+    return min(len(entries), REF_CACHE_MAX_ENTRIES)
+
+def _cached_reference_audio(ref_audio: str) -> str:
+    """Return a cached copy of the reference audio, creating it on a miss."""
+    key = hashlib.blake2b(ref_audio.encode(), digest_size=16).hexdigest()
+    path = _REF_CACHE_DIR / f"{key}.wav"
+    try:
+        # Hit: bump the mtime, which is the LRU order used by the sweep
+        os.utime(path)
+        return str(path)
+    except FileNotFoundError:
+        pass
+
+    with _ref_inflight_lock:
+        inflight = _ref_inflight.get(key)
+        if inflight is None:
+            inflight = _ref_inflight[key] = concurrent.futures.Future()
+            owner = True
+        else:
+            owner = False
+    if not owner:
+        return inflight.result()
+
+    try:
+        _fill_reference_cache(ref_audio, path)
+        inflight.set_result(str(path))
+    except BaseException as e:
+        inflight.set_exception(e)
+        raise
+    finally:
+        with _ref_inflight_lock:
+            del _ref_inflight[key]
+    return str(path)
+
+def _fill_reference_cache(ref_audio: str, path: Path) -> None:
+    """Write the reference audio to its cache path."""
+    _REF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".wav.tmp", dir=_REF_CACHE_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            _write_reference_audio(ref_audio, f)
+        # Publish atomically so readers never see a partial file
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+    global _ref_cache_count
+    with _ref_cache_lock:
+        if _ref_cache_count is None:
+            _ref_cache_count = len(_scan_reference_cache())
+        else:
+            _ref_cache_count += 1
+        if _ref_cache_count > REF_CACHE_MAX_ENTRIES:
+            _ref_cache_count = _sweep_reference_cache()
+
+DEFAULT_REFERENCE_AUDIO = "input/maya.wav"
+
+@functools.cache
+def _default_reference_audio() -> str:
+    """Return the default voice, downloading it on first use.
+
+    Once the file is in place it stays there for the life of the worker, so
+    later requests skip the existence check.
+    """
+    default_path = DEFAULT_REFERENCE_AUDIO
+    if not os.path.exists(default_path):
+        # Download default if not present, publishing it atomically so a
+        # killed worker never leaves a truncated voice behind
+        default_dir = os.path.dirname(default_path) or "."
+        os.makedirs(default_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".wav.tmp", dir=default_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                # Replace with actual URL
+                _download_to_file("https://example.com/maya.wav", f)
+            os.replace(tmp_path, default_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+    return default_path
+
+def process_reference_audio(ref_audio: Optional[str]) -> str:
+    """Process reference audio: handle base64, URL, or use default."""
+    if not ref_audio:
+        return _default_reference_audio()
+
+    if _REF_CACHE_DIR is not None:
+        return _cached_reference_audio(ref_audio)
+
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False, dir=REF_AUDIO_TMP_DIR) as f:
+        try:
+            _write_reference_audio(ref_audio, f)
         except Exception:
-            raise ValueError("Invalid base64 reference audio")
+            f.close()
+            os.unlink(f.name)
+            raise
+        return f.name
+
+WORKFLOW_PATH = Path(__file__).resolve().parent / "workflows" / "vibevoice_tts.json"
+
+# Parsed once at import and never mutated: modify_workflow shares every
+# node it does not override with the workflows it returns.
+_WORKFLOW_TEMPLATE = orjson.loads(WORKFLOW_PATH.read_bytes())
+
+def _override_widget(node: Dict[str, Any], value: Any) -> Dict[str, Any]:
+    """Return a copy of node with its first widget value replaced."""
+    return {**node, "widgets_values": [value, *node["widgets_values"][1:]]}
 
 def modify_workflow(text: str, ref_audio_path: str, temperature: float, speed: float, seed: int) -> Dict[str, Any]:
     """Modify the ComfyUI workflow with input parameters."""
-    with open("workflows/vibevoice_tts.json", "r") as f:
-        workflow = json.load(f)
+    # Copy only the path down to the five input widgets
+    nodes = _WORKFLOW_TEMPLATE["nodes"][:]
+    nodes[0] = _override_widget(nodes[0], text)  # Text input
+    nodes[1] = _override_widget(nodes[1], ref_audio_path)  # Reference audio
+    nodes[2] = _override_widget(nodes[2], temperature)  # Temperature
+    nodes[3] = _override_widget(nodes[3], speed)  # Speed
+    nodes[4] = _override_widget(nodes[4], seed)  # Seed
 
-    # Update node values
-    workflow["nodes"][0]["widgets_values"][0] = text  # Text input
-    workflow["nodes"][1]["widgets_values"][0] = ref_audio_path  # Reference audio
-    workflow["nodes"][2]["widgets_values"][0] = temperature  # Temperature
-    workflow["nodes"][3]["widgets_values"][0] = speed  # Speed
-    workflow["nodes"][4]["widgets_values"][0] = seed  # Seed
+    return {**_WORKFLOW_TEMPLATE, "nodes": nodes}
 
-    return workflow
+# Identifies this worker's websocket to ComfyUI, which sends a prompt's
+# events to the client that queued it.
+CLIENT_ID = uuid.uuid4().hex
+COMFY_HOST = "localhost:8188"
+COMFY_WS_URI = f"ws://{COMFY_HOST}/ws?clientId={CLIENT_ID}"
+# Prompts allowed in flight on the shared connection at once. Every prompt
+# saves to the same output file, so more than one lets concurrent jobs read
+# (or map while it is rewritten) each other's audio.
+MAX_CONCURRENT_PROMPTS = int(os.environ.get("COMFY_MAX_CONCURRENT_PROMPTS", 1))
+# Open the ComfyUI websocket at import instead of on the first request
+COMFY_PREWARM = os.environ.get("COMFY_PREWARM", "").lower() in ("1", "true", "yes")
+# Seconds the warm-up keeps retrying while ComfyUI is still starting
+COMFY_WARMUP_TIMEOUT = float(os.environ.get("COMFY_WARMUP_TIMEOUT", 120))
+COMFY_WARMUP_RETRY_DELAY = 0.5
+# Largest websocket frame accepted; ComfyUI's JSON events are a few KB, so
+# only a runaway preview image could exceed it (the connection then drops and
+# the next request reconnects)
+COMFY_WS_MAX_FRAME_BYTES = 1 << 20
 
-async def execute_workflow(workflow: Dict[str, Any]) -> str:
-    """Execute the workflow via ComfyUI websockets."""
-    uri = "ws://localhost:8188/ws"
-    try:
-        async with websockets.connect(uri) as websocket:
-            # Queue the prompt
-            prompt_msg = {
-                "type": "prompt",
-                "data": workflow
-            }
-            await websocket.send(json.dumps(prompt_msg))
-
-            # Wait for execution to complete
-            while True:
-                response = await websocket.recv()
-                data = json.loads(response)
+# A single event loop on a daemon thread serves every handler call, so the
+# ComfyUI websocket opened on it stays usable across requests.
+_loop = asyncio.new_event_loop()
+threading.Thread(target=_loop.run_forever, name="comfy-ws", daemon=True).start()
+
+def _on_execution_success(data: Dict[str, Any]) -> str:
+    # Assume output is saved to output/vibevoice_output.wav
+    return "output/vibevoice_output.wav"
 
-                if data["type"] == "execution_cached":
+def _on_execution_error(data: Dict[str, Any]) -> str:
+    details = data["data"]
+    message = details.get("exception_message") or details.get("message")
+    raise Exception(f"ComfyUI execution error: {message}")
+
+def _on_execution_interrupted(data: Dict[str, Any]) -> str:
+    raise Exception("ComfyUI execution interrupted")
+
+# Websocket message types that end a prompt; every other frame is skipped
+_MESSAGE_HANDLERS = {
+    "execution_success": _on_execution_success,
+    "execution_error": _on_execution_error,
+    "execution_interrupted": _on_execution_interrupted,
+}
+_TERMINAL_MARKERS = tuple(f'"{message_type}"' for message_type in _MESSAGE_HANDLERS)
+# The type field leads each ComfyUI frame, so a short prefix tells whether
+# a frame is worth parsing at all.
+_MESSAGE_PEEK_CHARS = 64
+
+class _PromptChannel:
+    """A ComfyUI websocket plus the prompts waiting on its events."""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.closed = False
+        self.reader = asyncio.ensure_future(self._receive())
+
+    def expect(self, prompt_id: str) -> asyncio.Future:
+        """Return a future resolved with the prompt's terminal message."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending[prompt_id] = future
+        return future
+
+    async def _receive(self) -> None:
+        """Route terminal frames to the prompt they belong to."""
+        error = ConnectionError("ComfyUI websocket closed")
+        try:
+            while True:
+                response = await self.websocket.recv()
+                if not isinstance(response, str):
+                    # Binary frames carry preview images, never prompt events
+                    continue
+                head = response[:_MESSAGE_PEEK_CHARS]
+                if not any(marker in head for marker in _TERMINAL_MARKERS):
+                    # execution_cached, progress, executing, status, ...
                     continue
-                elif data["type"] == "execution_success":
-                    # Assume output is saved to output/vibevoice_output.wav
-                    return "output/vibevoice_output.wav"
-                elif data["type"] == "execution_error":
-                    raise Exception(f"ComfyUI execution error: {data['data']['message']}")
+
+                data = orjson.loads(response)
+                prompt_id = (data.get("data") or {}).get("prompt_id")
+                future = self.pending.pop(prompt_id, None)
+                if future is not None and not future.done():
+                    future.set_result(data)
+        except Exception as e:
+            error = ConnectionError(f"ComfyUI websocket closed: {e}")
+        finally:
+            # Reconnect on the next request and fail whatever was still waiting
+            self.closed = True
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.pending.clear()
+
+_channel: Optional[_PromptChannel] = None
+_channel_lock = asyncio.Lock()
+_prompt_slots = asyncio.Semaphore(MAX_CONCURRENT_PROMPTS)
+
+async def _get_channel() -> _PromptChannel:
+    """Return the shared prompt channel, connecting on first use."""
+    global _channel
+    async with _channel_lock:
+        if _channel is None or _channel.closed:
+            # permessage-deflate only costs CPU on a loopback connection
+            websocket = await websockets.connect(
+                COMFY_WS_URI, ping_interval=20, ping_timeout=20,
+                max_size=COMFY_WS_MAX_FRAME_BYTES, compression=None,
+            )
+            _channel = _PromptChannel(websocket)
+        return _channel
+
+async def _warmup() -> None:
+    """Connect the shared channel as soon as ComfyUI accepts connections."""
+    deadline = asyncio.get_running_loop().time() + COMFY_WARMUP_TIMEOUT
+    while True:
+        try:
+            await _get_channel()
+            return
+        except Exception:
+            # ComfyUI not listening yet; the first request reports any
+            # error that outlasts the deadline
+            if asyncio.get_running_loop().time() >= deadline:
+                return
+            await asyncio.sleep(COMFY_WARMUP_RETRY_DELAY)
+
+_warmup_future = asyncio.run_coroutine_threadsafe(_warmup(), _loop) if COMFY_PREWARM else None
+
+async def _preconnect() -> None:
+    """Open the shared channel ahead of execute_workflow, which reports any failure."""
+    with contextlib.suppress(Exception):
+        await _get_channel()
+
+def _queue_prompt(workflow: Dict[str, Any], prompt_id: str) -> None:
+    """Queue a prompt through ComfyUI's REST API; events arrive on the websocket."""
+    payload = {"prompt": workflow, "client_id": CLIENT_ID, "prompt_id": prompt_id}
+    response = _SESSION.post(
+        f"http://{COMFY_HOST}/prompt",
+        data=orjson.dumps(payload),
+        headers={"Content-Type": "application/json"},
+        timeout=HTTP_TIMEOUT,
+    )
+    if response.status_code == 400:
+        raise ValueError(f"ComfyUI rejected the workflow: {response.text}")
+    response.raise_for_status()
+
+async def execute_workflow(workflow: Dict[str, Any]) -> str:
+    """Execute the workflow: queue it over HTTP, wait for its result on the websocket."""
+    try:
+        # Up to MAX_CONCURRENT_PROMPTS prompts are pipelined on the shared
+        # connection; their results are matched back by prompt_id.
+        async with _prompt_slots:
+            if _warmup_future is not None and not _warmup_future.done():
+                # Cold start: let the connection being opened finish first
+                await asyncio.wrap_future(_warmup_future)
+            prompt_id = uuid.uuid4().hex
+            channel = await _get_channel()
+            # Listen before queueing so a fast (e.g. fully cached) run is not missed
+            future = channel.expect(prompt_id)
+            try:
+                await asyncio.to_thread(_queue_prompt, workflow, prompt_id)
+                data = await future
+            finally:
+                channel.pending.pop(prompt_id, None)
+            return _MESSAGE_HANDLERS[data["type"]](data)
     except Exception as e:
         raise Exception(f"WebSocket error: {str(e)}")
 
-def get_audio_output(audio_path: str, seed: int) -> Dict[str, Any]:
-    """Get audio output as base64 with metadata."""
+def _wav_info(buf) -> Tuple[int, int]:
+    """Return (sample_rate, num_frames) parsed from a RIFF/WAVE header."""
+    if len(buf) < 12 or buf[0:4] != b"RIFF" or buf[8:12] != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE file")
+
+    sample_rate = block_align = data_size = None
+    offset = 12
+    while offset + 8 <= len(buf):
+        chunk_id = buf[offset:offset + 4]
+        chunk_size, = struct.unpack_from("<I", buf, offset + 4)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            if chunk_size < 14 or body + 14 > len(buf):
+                raise ValueError("Truncated fmt chunk in WAV file")
+            _, _, sample_rate, _, block_align = struct.unpack_from("<HHIIH", buf, body)
+        elif chunk_id == b"data":
+            # Streaming writers may leave the size unset, so clamp to the file
+            data_size = min(chunk_size, len(buf) - body)
+            break
+        # Chunks are word aligned
+        offset = body + chunk_size + (chunk_size & 1)
+
+    if not sample_rate or not block_align or data_size is None:
+        raise ValueError("Missing fmt or data chunk in WAV file")
+
+    return sample_rate, data_size // block_align
+
+# Bucket for return_mode="url" uploads; when unset, each upload uses the
+# runpod helper's naming for the current month
+BUCKET_NAME = os.environ.get("BUCKET_NAME")
+# Lifetime of the presigned audio URL in seconds (7 days, as in rp_upload)
+AUDIO_URL_EXPIRES = int(os.environ.get("AUDIO_URL_EXPIRES_SECONDS", "604800"))
+
+_s3 = None
+_s3_lock = threading.Lock()
+
+def _get_s3_client():
+    """Return the shared (client, transfer_config) pair, creating it on first use."""
+    global _s3
+    with _s3_lock:
+        if _s3 is None:
+            # Imported here so workers that never upload skip boto3 on cold start
+            from runpod.serverless.utils import rp_upload
+
+            client, transfer_config = rp_upload.get_boto_client()
+            if client is None:
+                raise ValueError(
+                    "URL return mode requires BUCKET_ENDPOINT_URL, BUCKET_ACCESS_KEY_ID "
+                    "and BUCKET_SECRET_ACCESS_KEY"
+                )
+            _s3 = (client, transfer_config)
+        return _s3
+
+def _upload_audio(f, audio_path: str, job_id: Optional[str]) -> str:
+    """Stream the open audio file to the bucket and return a presigned URL."""
+    client, transfer_config = _get_s3_client()
+    extension = os.path.splitext(audio_path)[1] or ".wav"
+    key = f"{job_id or 'tts'}/{uuid.uuid4().hex}{extension}"
+
+    # Resolved per upload so a long-lived worker follows the month
+    bucket = BUCKET_NAME or time.strftime("%m-%y")
+
+    f.seek(0)
+    client.upload_fileobj(
+        f, bucket, key,
+        ExtraArgs={"ContentType": "audio/" + extension.lstrip(".")},
+        Config=transfer_config,
+    )
+    return client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": bucket, "Key": key},
+        ExpiresIn=AUDIO_URL_EXPIRES,
+    )
+
+def _audio_info(buf, audio_path: str) -> Tuple[int, int]:
+    """Return (sample_rate, num_frames) without decoding any samples."""
     try:
-        import torchaudio
-        waveform, sample_rate = torchaudio.load(audio_path)
-        duration = waveform.shape[1] / sample_rate
+        return _wav_info(buf)
+    except ValueError:
+        if sf is None:
+            raise
+        # FLAC/OGG/RF64 output: libsndfile reads just the header
+        info = sf.info(audio_path)
+        return info.samplerate, info.frames
 
+def get_audio_output(
+    audio_path: str,
+    seed: int,
+    return_mode: str = "base64",
+    job_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Get audio output as base64 or a presigned URL, with metadata."""
+    try:
         with open(audio_path, "rb") as f:
-            audio_b64 = base64.b64encode(f.read()).decode()
+            # Map the file once: the header gives the duration without decoding
+            # samples, and the same pages are base64-encoded without a copy.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                sample_rate, num_frames = _audio_info(mm, audio_path)
+                if return_mode == "base64":
+                    output = {"audio_base64": _b64encode_str(mm)}
+            if return_mode == "url":
+                output = {"audio_url": _upload_audio(f, audio_path, job_id)}
 
-        return {
-            "audio_base64": audio_b64,
-            "duration": duration,
+        output.update({
+            "duration": num_frames / sample_rate,
             "sample_rate": sample_rate,
             "seed_used": seed
-        }
+        })
+        return output
     except Exception as e:
         raise Exception(f"Error processing audio output: {str(e)}")
 
-def handler(event):
+def _is_temp_reference(path: str) -> bool:
+    """Whether path is a per-request reference audio file to delete after the job."""
+    if _REF_CACHE_DIR is not None and path.startswith(os.path.join(_REF_CACHE_DIR, "")):
+        return False
+    return path.startswith(("/tmp", os.path.join(REF_AUDIO_TMP_DIR or "/tmp", "")))
+
+def _remove_temp_file(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+# Temp files are deleted by a background thread so the response does not wait
+# on the unlink
+_cleanup_queue: "queue.Queue[str]" = queue.Queue()
+
+def _cleanup_worker() -> None:
+    while True:
+        path = _cleanup_queue.get()
+        try:
+            _remove_temp_file(path)
+        finally:
+            _cleanup_queue.task_done()
+
+threading.Thread(target=_cleanup_worker, name="temp-cleanup", daemon=True).start()
+
+async def _handler_async(event):
     """
-    Main handler function for RunPod requests.
+    Process one request; runs on _loop only.
+
+    The websocket channel, the prompt slots and the warmup future are bound to
+    _loop, so awaiting this from any other loop is unsafe.
     """
-    temp_files = []
-    try:
-        # Validate input
-        input_data = event.get("input", {})
-        request = TTSRequest(**input_data)
-
-        # Process reference audio
-        ref_audio_path = process_reference_audio(request.reference_audio)
-        if ref_audio_path.startswith("/tmp"):  # Temp file
-            temp_files.append(ref_audio_path)
-
-        # Modify workflow
-        workflow = modify_workflow(
-            request.text,
-            ref_audio_path,
-            request.temperature,
-            request.speed,
-            request.seed
-        )
-
-        # Execute workflow
-        audio_path = asyncio.run(execute_workflow(workflow))
-
-        # Get output
-        output = get_audio_output(audio_path, request.seed)
+    # Cleanup callbacks registered on the stack run however the block exits
+    with contextlib.ExitStack() as cleanup:
+        try:
+            # Validate input
+            input_data = event.get("input", {})
+            request = TTSRequest.model_validate(input_data)
 
-        return output
+            # Process reference audio off the loop; it may download or decode,
+            # so connect to ComfyUI in the meantime
+            ref_audio_path, _ = await asyncio.gather(
+                asyncio.to_thread(process_reference_audio, request.reference_audio),
+                _preconnect(),
+            )
+            if _is_temp_reference(ref_audio_path):
+                cleanup.callback(_cleanup_queue.put, ref_audio_path)
 
-    except Exception as e:
-        return {"error": str(e)}
-    finally:
-        # Cleanup temp files
-        for temp_file in temp_files:
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
+            # Modify workflow
+            workflow = modify_workflow(
+                request.text,
+                ref_audio_path,
+                request.temperature,
+                request.speed,
+                request.seed
+            )
+
+            # Execute workflow
+            audio_path = await execute_workflow(workflow)
+
+            # Get output
+            output = await asyncio.to_thread(
+                get_audio_output, audio_path, request.seed, request.return_mode, event.get("id")
+            )
+
+            return output
+
+        except Exception as e:
+            return {"error": str(e)}
+
+async def handler_async(event):
+    """
+    Coroutine variant of handler for callers that run their own event loop.
+    """
+    # The request itself runs on the shared loop, which owns the websocket
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_handler_async(event), _loop))
+
+def handler(event):
+    """
+    Main handler function for RunPod requests.
+    """
+    # Run on the shared event loop so concurrent calls share one websocket
+    return asyncio.run_coroutine_threadsafe(_handler_async(event), _loop).result()
 
 if __name__ == "__main__":
     # Test handler
@@ -10,6 +10,18 @@ import sys
 import os
 from pathlib import Path
 
+# Repository root: tests run from here and it goes on PYTHONPATH
+ROOT = Path(__file__).resolve().parent
+
+# Environment shared by every test subprocess, built once
+ENV = {
+    **os.environ,
+    # Test runs should not leave __pycache__ writes behind
+    "PYTHONDONTWRITEBYTECODE": "1",
+}
+ENV.setdefault("PYTHONPATH", str(ROOT))
+ENV.setdefault("PYTHONHASHSEED", "0")
+
 
 def run_unit_tests(args):
     """Run unit tests."""
@@ -23,7 +35,11 @@ def run_unit_tests(args):
     if args.coverage:
         cmd.extend(["--cov=rp_handler", "--cov-report=html"])
 
-    return subprocess.run(cmd, cwd=Path(__file__).parent)
+    if args.parallel:
+        # Spread the test cases over one pytest-xdist worker per CPU
+        cmd.extend(["-n", "auto"])
+
+    return subprocess.run(cmd, cwd=ROOT, env=ENV)
 
 
 def run_performance_tests(args):
@@ -38,7 +54,7 @@ def run_performance_tests(args):
     if args.benchmark:
         cmd.extend(["--benchmark-only", "--benchmark-save=performance_results"])
 
-    return subprocess.run(cmd, cwd=Path(__file__).parent)
+    return subprocess.run(cmd, cwd=ROOT, env=ENV)
 
 
 def run_integration_tests(args):
@@ -57,7 +73,7 @@ def run_integration_tests(args):
         "up", "--build", "--abort-on-container-exit"
     ]
 
-    return subprocess.run(cmd, cwd=Path(__file__).parent)
+    return subprocess.run(cmd, cwd=ROOT, env=ENV)
 
 
 def run_all_tests(args):
@@ -90,6 +106,11 @@ def main():
         action="store_true",
         help="Generate coverage report"
     )
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="Run unit tests across CPU cores (requires pytest-xdist)"
+    )
     parser.add_argument(
         "--benchmark",
         action="store_true",
@@ -103,9 +124,6 @@ def main():
 
     args = parser.parse_args()
 
-    # Set up environment
-    os.environ.setdefault("PYTHONPATH", str(Path(__file__).parent))
-
     # Run appropriate test mode
     if args.mode == "unit":
         result = run_unit_tests(args)
@@ -6,14 +6,70 @@ This script configures auto-scaling parameters for optimal GPU utilization
 and cost efficiency based on workload patterns.
 """
 
-import json
-import os
 from pathlib import Path
 from typing import Dict, Any, List
 
+from config_io import default_project_root, write_json_atomic
+
+# Predefined scaling profiles, in the order they are written to the config
+SCALING_PROFILES = (
+    # Development profile - cost optimized
+    ("development", {
+        "description": "Development environment with minimal scaling",
+        "min_instances": 1,
+        "max_instances": 2,
+        "target_concurrency": 1,
+        "scale_up_threshold": 0.9,
+        "scale_down_threshold": 0.2,
+        "cpu_threshold": 80,
+        "memory_threshold": 85,
+        "gpu_threshold": 80,
+        "queue_depth_threshold": 5
+    }),
+    # Production profile - balanced performance/cost
+    ("production", {
+        "description": "Production environment with balanced scaling",
+        "min_instances": 2,
+        "max_instances": 10,
+        "target_concurrency": 3,
+        "scale_up_threshold": 0.7,
+        "scale_down_threshold": 0.4,
+        "cpu_threshold": 70,
+        "memory_threshold": 80,
+        "gpu_threshold": 75,
+        "queue_depth_threshold": 15
+    }),
+    # High-throughput profile - performance optimized
+    ("high-throughput", {
+        "description": "High-throughput environment for peak loads",
+        "min_instances": 5,
+        "max_instances": 20,
+        "target_concurrency": 5,
+        "scale_up_threshold": 0.6,
+        "scale_down_threshold": 0.5,
+        "cpu_threshold": 60,
+        "memory_threshold": 75,
+        "gpu_threshold": 70,
+        "queue_depth_threshold": 25
+    }),
+    # Cost-optimized profile - minimal resources
+    ("cost-optimized", {
+        "description": "Cost-optimized for low-traffic periods",
+        "min_instances": 1,
+        "max_instances": 3,
+        "target_concurrency": 1,
+        "scale_up_threshold": 0.95,
+        "scale_down_threshold": 0.1,
+        "cpu_threshold": 90,
+        "memory_threshold": 90,
+        "gpu_threshold": 85,
+        "queue_depth_threshold": 3
+    }),
+)
+
 class AutoScaler:
     def __init__(self, project_root: str = None):
-        self.project_root = Path(project_root or os.getcwd())
+        self.project_root = Path(project_root) if project_root else default_project_root()
         self.runpod_dir = self.project_root / ".runpod"
 
     def create_scaling_profile(self, profile_name: str, config: Dict[str, Any]) -> Dict[str, Any]:
@@ -45,69 +101,7 @@ class AutoScaler:
     def generate_scaling_profiles(self) -> List[Dict[str, Any]]:
         """Generate predefined scaling profiles for different use cases"""
 
-        profiles = []
-
-        # Development profile - cost optimized
-        dev_config = {
-            "description": "Development environment with minimal scaling",
-            "min_instances": 1,
-            "max_instances": 2,
-            "target_concurrency": 1,
-            "scale_up_threshold": 0.9,
-            "scale_down_threshold": 0.2,
-            "cpu_threshold": 80,
-            "memory_threshold": 85,
-            "gpu_threshold": 80,
-            "queue_depth_threshold": 5
-        }
-        profiles.append(self.create_scaling_profile("development", dev_config))
-
-        # Production profile - balanced performance/cost
-        prod_config = {
-            "description": "Production environment with balanced scaling",
-            "min_instances": 2,
-            "max_instances": 10,
-            "target_concurrency": 3,
-            "scale_up_threshold": 0.7,
-            "scale_down_threshold": 0.4,
-            "cpu_threshold": 70,
-            "memory_threshold": 80,
-            "gpu_threshold": 75,
-            "queue_depth_threshold": 15
-        }
-        profiles.append(self.create_scaling_profile("production", prod_config))
-
-        # High-throughput profile - performance optimized
-        ht_config = {
-            "description": "High-throughput environment for peak loads",
-            "min_instances": 5,
-            "max_instances": 20,
-            "target_concurrency": 5,
-            "scale_up_threshold": 0.6,
-            "scale_down_threshold": 0.5,
-            "cpu_threshold": 60,
-            "memory_threshold": 75,
-            "gpu_threshold": 70,
-            "queue_depth_threshold": 25
-        }
-        profiles.append(self.create_scaling_profile("high-throughput", ht_config))
-
-        # Cost-optimized profile - minimal resources
-        cost_config = {
-            "description": "Cost-optimized for low-traffic periods",
-            "min_instances": 1,
-            "max_instances": 3,
-            "target_concurrency": 1,
-            "scale_up_threshold": 0.95,
-            "scale_down_threshold": 0.1,
-            "cpu_threshold": 90,
-            "memory_threshold": 90,
-            "gpu_threshold": 85,
-            "queue_depth_threshold": 3
-        }
-        profiles.append(self.create_scaling_profile("cost-optimized", cost_config))
-
-        return profiles
+        return [self.create_scaling_profile(name, config) for name, config in SCALING_PROFILES]
 
     def create_time_based_schedules(self) -> List[Dict[str, Any]]:
         """Create time-based scaling schedules"""
@@ -163,8 +157,7 @@ class AutoScaler:
         """Save auto-scaling configuration to file"""
 
         config_file = self.runpod_dir / filename
-        with open(config_file, 'w') as f:
-            json.dump(config, f, indent=2)
+        write_json_atomic(config_file, config)
 
         print(f"Auto-scaling configuration saved to {config_file}")
         return config_file
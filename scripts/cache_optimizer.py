@@ -6,14 +6,14 @@ This script implements comprehensive caching strategies for dependencies,
 models, and intermediate results to improve performance and reduce costs.
 """
 
-import json
-import os
 from pathlib import Path
 from typing import Dict, Any, List
 
+from config_io import default_project_root, write_json_atomic
+
 class CacheOptimizer:
     def __init__(self, project_root: str = None):
-        self.project_root = Path(project_root or os.getcwd())
+        self.project_root = Path(project_root) if project_root else default_project_root()
         self.runpod_dir = self.project_root / ".runpod"
 
     def create_model_cache_config(self) -> Dict[str, Any]:
@@ -97,6 +97,19 @@ class CacheOptimizer:
 
         return workflow_cache
 
+    def create_reference_audio_cache_config(self) -> Dict[str, Any]:
+        """Create reference audio caching configuration"""
+
+        ref_audio_cache = {
+            "enabled": True,
+            "cacheDir": "/workspace/.cache/refaudio",
+            "maxEntries": 256,
+            "keyAlgorithm": "blake2b-128",
+            "evictionPolicy": "LRU"
+        }
+
+        return ref_audio_cache
+
     def create_network_cache_config(self) -> Dict[str, Any]:
         """Create network caching configuration"""
 
@@ -202,6 +215,7 @@ class CacheOptimizer:
             "modelCache": self.create_model_cache_config(),
             "dependencyCache": self.create_dependency_cache_config(),
             "workflowCache": self.create_workflow_cache_config(),
+            "referenceAudioCache": self.create_reference_audio_cache_config(),
             "networkCache": self.create_network_cache_config(),
             "vramOptimization": self.create_vram_optimization_config(),
             "monitoring": self.create_performance_monitoring_config(),
@@ -219,8 +233,7 @@ class CacheOptimizer:
         """Save cache configuration to file"""
 
         config_file = self.runpod_dir / filename
-        with open(config_file, 'w') as f:
-            json.dump(config, f, indent=2)
+        write_json_atomic(config_file, config)
 
         print(f"Cache configuration saved to {config_file}")
         return config_file
@@ -0,0 +1,36 @@
+"""
+Shared file helpers for the RunPod configuration scripts.
+"""
+
+import functools
+import orjson
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+@functools.cache
+def default_project_root() -> Path:
+    """Working directory at first use, the default project root for every script."""
+    return Path.cwd()
+
+def write_json_atomic(path: Path, config: Any) -> None:
+    """Write config as indented JSON so readers never see a partial file.
+
+    The data goes to a temporary file in the same directory, which then
+    replaces path in a single rename.
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(orjson.dumps(config, option=orjson.OPT_INDENT_2))
+        # mkstemp creates the file owner-only; keep the usual config permissions
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
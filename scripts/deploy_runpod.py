@@ -6,16 +6,48 @@ This script handles the deployment of the VibeVoice TTS worker to RunPod serverl
 with optimized configurations for GPU inference, caching, and auto-scaling.
 """
 
-import os
-import json
+import hashlib
+import orjson
 import subprocess
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+
+from config_io import default_project_root, write_json_atomic
+
+# Lines of build output kept for the failure message
+BUILD_LOG_TAIL_LINES = 20
+# buildx builder used for registry layer caching, which the default
+# "docker" driver does not support
+BUILDX_BUILDER = "vibevoice-builder"
+# Files whose contents determine the image: the Dockerfile and everything it
+# COPYs from the build context. A local image labelled with the same digest
+# (which also covers the resolved base images) is reused instead of rebuilt
+BUILD_INPUT_FILES = (
+    "Dockerfile",
+    "input/Kirk_BSidesSeattle[2cx1K6z7YTQ].wav",
+)
+SOURCE_DIGEST_LABEL = "vibevoice.src_digest"
+
+def run_streaming(cmd, cwd) -> subprocess.CompletedProcess:
+    """Run a command, echoing its output line by line as it is produced.
+
+    Only the last BUILD_LOG_TAIL_LINES lines are retained (as stdout of the
+    returned CompletedProcess), so long build logs are never held in memory.
+    """
+    tail = deque(maxlen=BUILD_LOG_TAIL_LINES)
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          bufsize=1, text=True, cwd=cwd) as proc:
+        for line in proc.stdout:
+            print(line, end="")
+            tail.append(line)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout="".join(tail))
 
 class RunPodDeployer:
     def __init__(self, project_root: str = None):
-        self.project_root = Path(project_root or os.getcwd())
+        self.project_root = Path(project_root) if project_root else default_project_root()
         self.runpod_dir = self.project_root / ".runpod"
         self.config_file = self.runpod_dir / "hub.json"
 
@@ -24,8 +56,8 @@ class RunPodDeployer:
         if not self.config_file.exists():
             raise FileNotFoundError(f"Configuration file not found: {self.config_file}")
 
-        with open(self.config_file, 'r') as f:
-            return json.load(f)
+        with open(self.config_file, 'rb') as f:
+            return orjson.loads(f.read())
 
     def validate_deployment(self) -> bool:
         """Validate deployment prerequisites"""
@@ -48,27 +80,133 @@ class RunPodDeployer:
         print("All required files present")
         return True
 
-    def build_docker_image(self, tag: str = "latest") -> bool:
-        """Build Docker image for deployment"""
+    def ensure_buildx_builder(self) -> None:
+        """Create the docker-container buildx builder on first use"""
+        inspect = subprocess.run(
+            ["docker", "buildx", "inspect", BUILDX_BUILDER],
+            capture_output=True, cwd=self.project_root
+        )
+        if inspect.returncode != 0:
+            subprocess.run(
+                ["docker", "buildx", "create", "--name", BUILDX_BUILDER, "--driver", "docker-container"],
+                check=True, capture_output=True, cwd=self.project_root
+            )
+
+    def base_images(self) -> List[str]:
+        """Return the external images the Dockerfile builds FROM"""
+        images = []
+        stages = set()
+        continued = False
+        with open(self.project_root / "Dockerfile") as f:
+            for line in f:
+                # Continuation lines (such as inline RUN scripts) are not instructions
+                is_continuation, continued = continued, line.rstrip().endswith("\\")
+                words = line.split()
+                if is_continuation or len(words) < 2 or words[0].upper() != "FROM":
+                    continue
+                # Skip flags such as --platform
+                args = [w for w in words[1:] if not w.startswith("--")]
+                if args[0] not in stages and args[0] not in images:
+                    images.append(args[0])
+                if len(args) >= 3 and args[1].lower() == "as":
+                    stages.add(args[2])
+        return images
+
+    def resolve_image_digest(self, image: str) -> Optional[str]:
+        """Return the registry manifest digest a tag currently points to"""
+        result = subprocess.run(
+            ["docker", "buildx", "imagetools", "inspect", image, "--format", "{{.Manifest.Digest}}"],
+            capture_output=True, text=True, cwd=self.project_root
+        )
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip() or None
+
+    def compute_source_digest(self) -> Optional[str]:
+        """Hash the build inputs, streaming each file in chunks
+
+        The digests the base image tags resolve to are hashed too, so a moved
+        tag such as :latest invalidates the local image. Returns None when a
+        base image cannot be resolved, since the image can then not be shown
+        to be current.
+        """
+        digest = hashlib.blake2b()
+        for image in self.base_images():
+            image_digest = self.resolve_image_digest(image)
+            if image_digest is None:
+                return None
+            digest.update(f"{image}@{image_digest}".encode() + b"\0")
+        for file_path in BUILD_INPUT_FILES:
+            digest.update(file_path.encode() + b"\0")
+            try:
+                with open(self.project_root / file_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 16), b""):
+                        digest.update(chunk)
+            except FileNotFoundError:
+                digest.update(b"<missing>")
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def local_image_digest(self, image_name: str) -> Optional[str]:
+        """Return the source digest label of a local image, if it exists"""
+        result = subprocess.run(
+            ["docker", "image", "inspect", "-f",
+             f'{{{{index .Config.Labels "{SOURCE_DIGEST_LABEL}"}}}}', image_name],
+            capture_output=True, text=True, cwd=self.project_root
+        )
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip() or None
+
+    def build_docker_image(self, tag: str = "latest", registry: Optional[str] = None,
+                           cache_ref: Optional[str] = None, force: bool = False) -> bool:
+        """Build Docker image for deployment, pushing it straight to registry if given.
+
+        With cache_ref, layers are pulled from and exported to that registry
+        reference, so unchanged steps (pip installs, model downloads) are not
+        re-run on a cold builder. A local build is skipped when the existing
+        image was built from the same inputs, unless force is set.
+        """
         image_name = f"vibevoice-tts-worker:{tag}"
-
-        print(f"Building Docker image: {image_name}")
+        if registry:
+            image_name = f"{registry}/{image_name}"
 
         try:
-            cmd = [
-                "docker", "build",
+            source_digest = self.compute_source_digest()
+            if (source_digest and not registry and not force
+                    and self.local_image_digest(image_name) == source_digest):
+                print(f"Docker image {image_name} is up to date, skipping build")
+                return True
+
+            print(f"Building Docker image: {image_name}")
+
+            cmd = ["docker", "buildx", "build"]
+            if source_digest:
+                cmd.extend(["--label", f"{SOURCE_DIGEST_LABEL}={source_digest}"])
+            if cache_ref:
+                self.ensure_buildx_builder()
+                cmd.extend([
+                    "--builder", BUILDX_BUILDER,
+                    "--cache-from", f"type=registry,ref={cache_ref}",
+                    # mode=max also caches the intermediate stages
+                    "--cache-to", f"type=registry,ref={cache_ref},mode=max",
+                ])
+            cmd.extend([
                 "-t", image_name,
                 "-f", str(self.project_root / "Dockerfile"),
+                # Pushing writes layers straight to the registry, skipping the
+                # local image store and a separate tag + push
+                "--output", "type=registry" if registry else "type=docker",
                 str(self.project_root)
-            ]
+            ])
 
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=self.project_root)
+            result = run_streaming(cmd, cwd=self.project_root)
 
             if result.returncode != 0:
-                print(f"Docker build failed: {result.stderr}")
+                print(f"Docker build failed:\n{result.stdout}")
                 return False
 
-            print("Docker image built successfully")
+            print("Docker image built and pushed successfully" if registry else "Docker image built successfully")
             return True
 
         except Exception as e:
@@ -76,7 +214,7 @@ class RunPodDeployer:
             return False
 
     def push_to_registry(self, registry: str, tag: str = "latest") -> bool:
-        """Push Docker image to registry"""
+        """Push an already built local Docker image to registry"""
         image_name = f"vibevoice-tts-worker:{tag}"
         full_image_name = f"{registry}/{image_name}"
 
@@ -98,10 +236,8 @@ class RunPodDeployer:
             print(f"Error pushing image: {e}")
             return False
 
-    def deploy_serverless(self, config: Dict[str, Any]) -> bool:
-        """Deploy to RunPod serverless"""
-        print("Deploying to RunPod serverless...")
-
+    def deploy_serverless(self, config: Dict[str, Any]) -> Path:
+        """Write the RunPod serverless deployment configuration"""
         # This would typically use RunPod CLI or API
         # For now, we'll create a deployment configuration file
 
@@ -128,18 +264,10 @@ class RunPodDeployer:
 
         # Save deployment configuration
         deploy_file = self.runpod_dir / "deployment.json"
-        with open(deploy_file, 'w') as f:
-            json.dump(deployment_config, f, indent=2)
+        write_json_atomic(deploy_file, deployment_config)
+        return deploy_file
 
-        print(f"Deployment configuration saved to {deploy_file}")
-        print("Next steps:")
-        print("1. Push your Docker image to a registry")
-        print("2. Use RunPod CLI or web interface to deploy")
-        print("3. Configure auto-scaling based on your needs")
-
-        return True
-
-    def setup_network_volume(self) -> bool:
+    def setup_network_volume(self) -> Path:
         """Setup network volume configuration for persistent storage"""
         volume_config = {
             "name": "vibevoice-models-volume",
@@ -154,13 +282,10 @@ class RunPodDeployer:
         }
 
         volume_file = self.runpod_dir / "network-volume.json"
-        with open(volume_file, 'w') as f:
-            json.dump(volume_config, f, indent=2)
-
-        print(f"Network volume configuration saved to {volume_file}")
-        return True
+        write_json_atomic(volume_file, volume_config)
+        return volume_file
 
-    def optimize_for_production(self) -> bool:
+    def optimize_for_production(self) -> Path:
         """Apply production optimizations"""
         optimizations = {
             "model_cache": {
@@ -183,11 +308,8 @@ class RunPodDeployer:
         }
 
         opt_file = self.runpod_dir / "optimizations.json"
-        with open(opt_file, 'w') as f:
-            json.dump(optimizations, f, indent=2)
-
-        print(f"Production optimizations saved to {opt_file}")
-        return True
+        write_json_atomic(opt_file, optimizations)
+        return opt_file
 
 def main():
     parser = argparse.ArgumentParser(description="Deploy VibeVoice TTS to RunPod")
@@ -195,6 +317,12 @@ def main():
     parser.add_argument("--tag", default="latest", help="Docker image tag")
     parser.add_argument("--skip-build", action="store_true", help="Skip Docker build")
     parser.add_argument("--skip-push", action="store_true", help="Skip Docker push")
+    parser.add_argument("--cache-ref",
+                        help="Registry reference for the build layer cache "
+                             "(default: <registry>/vibevoice-tts-worker:buildcache)")
+    parser.add_argument("--no-cache", action="store_true", help="Build without the registry layer cache")
+    parser.add_argument("--force-build", action="store_true",
+                        help="Rebuild even if the local image matches the current sources")
 
     args = parser.parse_args()
 
@@ -211,29 +339,54 @@ def main():
         print(f"Error loading configuration: {e}")
         return 1
 
-    # Build Docker image
-    if not args.skip_build:
-        if not deployer.build_docker_image(args.tag):
-            return 1
-
-    # Push to registry
-    if args.registry and not args.skip_push:
-        if not deployer.push_to_registry(args.registry, args.tag):
-            return 1
-
-    # Setup network volume
-    deployer.setup_network_volume()
-
-    # Apply production optimizations
-    deployer.optimize_for_production()
+    push = bool(args.registry) and not args.skip_push
+    cache_ref = None
+    if not args.no_cache:
+        # Exporting the default cache writes to the registry, so --skip-push
+        # only uses a cache that was named explicitly
+        cache_ref = args.cache_ref or (f"{args.registry}/vibevoice-tts-worker:buildcache" if push else None)
+
+    def publish_image() -> bool:
+        # Build Docker image, pushing it in the same buildx run when requested
+        if not args.skip_build:
+            return deployer.build_docker_image(args.tag, args.registry if push else None, cache_ref,
+                                               force=args.force_build)
+        # Push a previously built image
+        if push:
+            return deployer.push_to_registry(args.registry, args.tag)
+        return True
 
-    # Deploy to serverless
-    if deployer.deploy_serverless(config):
-        print("\nDeployment preparation completed!")
-        print("Use the generated configuration files to complete deployment via RunPod CLI or web interface.")
-        return 0
-    else:
+    # The image build (a subprocess) and the three config files are
+    # independent, so the configs are written while docker runs. The writers
+    # print nothing, keeping the docker log clean; their messages and the
+    # "Next steps" text wait until the image is published. result()
+    # re-raises any failure
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        volume = pool.submit(deployer.setup_network_volume)
+        optimizations = pool.submit(deployer.optimize_for_production)
+        deployment = pool.submit(deployer.deploy_serverless, config)
+        image_published = publish_image()
+        volume_file = volume.result()
+        opt_file = optimizations.result()
+        deploy_file = deployment.result()
+
+    if not image_published:
+        # Do not leave configs behind for an image that was never published
+        for path in (volume_file, opt_file, deploy_file):
+            path.unlink(missing_ok=True)
         return 1
 
+    print(f"Network volume configuration saved to {volume_file}")
+    print(f"Production optimizations saved to {opt_file}")
+    print(f"Deployment configuration saved to {deploy_file}")
+    print("Next steps:")
+    print("1. Push your Docker image to a registry")
+    print("2. Use RunPod CLI or web interface to deploy")
+    print("3. Configure auto-scaling based on your needs")
+
+    print("\nDeployment preparation completed!")
+    print("Use the generated configuration files to complete deployment via RunPod CLI or web interface.")
+    return 0
+
 if __name__ == "__main__":
     exit(main())
\ No newline at end of file
@@ -6,117 +6,102 @@ This script configures network volumes for persistent storage of models,
 cache, and other data that needs to persist across container restarts.
 """
 
-import json
-import os
 from pathlib import Path
 from typing import Dict, Any, List
 
+from config_io import default_project_root, write_json_atomic
+
+# Volume definitions, built once; generate_volume_config shares them with
+# the configs it returns, which are only serialized
+VOLUME_SPECS = (
+    # Model storage volume
+    {
+        "name": "vibevoice-models",
+        "description": "Persistent storage for TTS models and weights",
+        "sizeGb": 100,
+        "mountPath": "/workspace/models",
+        "filesystem": "ext4",
+        "performance": "high",
+        "backup": {
+            "enabled": True,
+            "schedule": "daily",
+            "retentionDays": 30,
+            "type": "incremental"
+        },
+        "encryption": {
+            "enabled": True,
+            "algorithm": "AES256"
+        },
+        "directories": [
+            "tts/VibeVoice",
+            "checkpoints",
+            "loras",
+            "embeddings"
+        ]
+    },
+    # Cache storage volume
+    {
+        "name": "vibevoice-cache",
+        "description": "Fast storage for caches and temporary data",
+        "sizeGb": 50,
+        "mountPath": "/workspace/.cache",
+        "filesystem": "ext4",
+        "performance": "high",
+        "persistence": "session",
+        "directories": [
+            "pip",
+            "conda",
+            "huggingface",
+            "torch",
+            "workflows",
+            "http"
+        ]
+    },
+    # Output storage volume
+    {
+        "name": "vibevoice-outputs",
+        "description": "Storage for generated audio outputs and logs",
+        "sizeGb": 25,
+        "mountPath": "/workspace/outputs",
+        "filesystem": "ext4",
+        "performance": "standard",
+        "retention": {
+            "enabled": True,
+            "maxAgeDays": 7,
+            "autoCleanup": True
+        },
+        "directories": [
+            "audio",
+            "logs",
+            "temp"
+        ]
+    },
+    # Configuration volume
+    {
+        "name": "vibevoice-config",
+        "description": "Storage for configuration files and settings",
+        "sizeGb": 5,
+        "mountPath": "/workspace/config",
+        "filesystem": "ext4",
+        "performance": "standard",
+        "backup": {
+            "enabled": True,
+            "schedule": "weekly",
+            "retentionDays": 90
+        },
+        "files": [
+            "workflow_defaults.json",
+            "model_configs.json",
+            "scaling_profiles.json"
+        ]
+    },
+)
+
 class NetworkVolumeSetup:
     def __init__(self, project_root: str = None):
-        self.project_root = Path(project_root or os.getcwd())
+        self.project_root = Path(project_root) if project_root else default_project_root()
         self.runpod_dir = self.project_root / ".runpod"
 
-    def create_model_volume_config(self) -> Dict[str, Any]:
-        """Create model storage volume configuration"""
-
-        model_volume = {
-            "name": "vibevoice-models",
-            "description": "Persistent storage for TTS models and weights",
-            "sizeGb": 100,
-            "mountPath": "/workspace/models",
-            "filesystem": "ext4",
-            "performance": "high",
-            "backup": {
-                "enabled": True,
-                "schedule": "daily",
-                "retentionDays": 30,
-                "type": "incremental"
-            },
-            "encryption": {
-                "enabled": True,
-                "algorithm": "AES256"
-            },
-            "directories": [
-                "tts/VibeVoice",
-                "checkpoints",
-                "loras",
-                "embeddings"
-            ]
-        }
-
-        return model_volume
-
-    def create_cache_volume_config(self) -> Dict[str, Any]:
-        """Create cache storage volume configuration"""
-
-        cache_volume = {
-            "name": "vibevoice-cache",
-            "description": "Fast storage for caches and temporary data",
-            "sizeGb": 50,
-            "mountPath": "/workspace/.cache",
-            "filesystem": "ext4",
-            "performance": "high",
-            "persistence": "session",
-            "directories": [
-                "pip",
-                "conda",
-                "huggingface",
-                "torch",
-                "workflows",
-                "http"
-            ]
-        }
-
-        return cache_volume
-
-    def create_output_volume_config(self) -> Dict[str, Any]:
-        """Create output storage volume configuration"""
-
-        output_volume = {
-            "name": "vibevoice-outputs",
-            "description": "Storage for generated audio outputs and logs",
-            "sizeGb": 25,
-            "mountPath": "/workspace/outputs",
-            "filesystem": "ext4",
-            "performance": "standard",
-            "retention": {
-                "enabled": True,
-                "maxAgeDays": 7,
-                "autoCleanup": True
-            },
-            "directories": [
-                "audio",
-                "logs",
-                "temp"
-            ]
-        }
-
-        return output_volume
-
-    def create_config_volume_config(self) -> Dict[str, Any]:
-        """Create configuration volume configuration"""
-
-        config_volume = {
-            "name": "vibevoice-config",
-            "description": "Storage for configuration files and settings",
-            "sizeGb": 5,
-            "mountPath": "/workspace/config",
-            "filesystem": "ext4",
-            "performance": "standard",
-            "backup": {
-                "enabled": True,
-                "schedule": "weekly",
-                "retentionDays": 90
-            },
-            "files": [
-                "workflow_defaults.json",
-                "model_configs.json",
-                "scaling_profiles.json"
-            ]
-        }
-
-        return config_volume
-
     def create_volume_mounts_config(self) -> List[Dict[str, Any]]:
         """Create volume mounts configuration"""
 
@@ -181,12 +166,7 @@ class NetworkVolumeSetup:
         config = {
             "version": "1.0",
             "description": "Network volume configuration for VibeVoice TTS worker",
-            "volumes": [
-                self.create_model_volume_config(),
-                self.create_cache_volume_config(),
-                self.create_output_volume_config(),
-                self.create_config_volume_config()
-            ],
+            "volumes": list(VOLUME_SPECS),
             "mounts": self.create_volume_mounts_config(),
             "snapshots": self.create_snapshot_config(),
             "monitoring": {
@@ -210,8 +190,7 @@ class NetworkVolumeSetup:
         """Save network volume configuration to file"""
 
         config_file = self.runpod_dir / filename
-        with open(config_file, 'w') as f:
-            json.dump(config, f, indent=2)
+        write_json_atomic(config_file, config)
 
         print(f"Network volume configuration saved to {config_file}")
         return config_file
@@ -225,25 +204,34 @@ def main():
     # Save configuration
     config_file = setup.save_config(config)
 
-    print("\nNetwork Volume Configuration Summary:")
-    print(f"   Total Volumes: {len(config['volumes'])}")
-    print(f"   Total Storage: {sum(v['sizeGb'] for v in config['volumes'])}GB")
-
-    print("\nVolume Details:")
+    # Volume details and the storage total come from a single pass
+    total_storage = 0
+    volume_lines = []
     for volume in config['volumes']:
-        backup_status = "Enabled" if volume.get('backup', {}).get('enabled', False) else "Disabled"
-        print(f"   • {volume['name']}: {volume['sizeGb']}GB - {volume['description']}")
-        print(f"     Mount: {volume['mountPath']} | Backup: {backup_status}")
-
-    print("\nMount Points:")
-    for mount in config['mounts']:
-        read_only = " (RO)" if mount.get('readOnly', False) else ""
-        print(f"   • {mount['mountPath']}{read_only}")
-
-    print("\nSnapshot Configuration:")
+        total_storage += volume['sizeGb']
+        backup = volume.get('backup')
+        backup_status = "Enabled" if backup and backup.get('enabled', False) else "Disabled"
+        volume_lines.append(f"   • {volume['name']}: {volume['sizeGb']}GB - {volume['description']}")
+        volume_lines.append(f"     Mount: {volume['mountPath']} | Backup: {backup_status}")
+
+    mount_lines = [
+        f"   • {mount['mountPath']}{' (RO)' if mount.get('readOnly', False) else ''}"
+        for mount in config['mounts']
+    ]
     snapshot = config['snapshots']
-    print(f"   • Schedule: {snapshot['schedule']}")
-    print(f"   • Retention: {snapshot['retention']['daily']} daily, {snapshot['retention']['weekly']} weekly")
+
+    print("\n".join([
+        "\nNetwork Volume Configuration Summary:",
+        f"   Total Volumes: {len(config['volumes'])}",
+        f"   Total Storage: {total_storage}GB",
+        "\nVolume Details:",
+        *volume_lines,
+        "\nMount Points:",
+        *mount_lines,
+        "\nSnapshot Configuration:",
+        f"   • Schedule: {snapshot['schedule']}",
+        f"   • Retention: {snapshot['retention']['daily']} daily, {snapshot['retention']['weekly']} weekly",
+    ]))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,169 +6,152 @@ This script implements VRAM optimization techniques for efficient model loading
 and memory management in GPU environments.
 """
 
-import json
-import os
 from pathlib import Path
 from typing import Dict, Any, List
 
+from config_io import default_project_root, write_json_atomic
+
+# Static sections of the VRAM config, built once at import and shared by
+# every generated config, which is only serialized
+
+# Efficient model loading
+MODEL_LOADING_CONFIG = {
+    "memoryEfficientLoading": {
+        "enabled": True,
+        "loadIn8bit": False,
+        "loadIn4bit": False,
+        "deviceMap": "auto",
+        "torchDtype": "float16",
+        "lowCpuMemUsage": True
+    },
+    "modelSharding": {
+        "enabled": True,
+        "maxMemory": {
+            "0": "8GB",
+            "cpu": "16GB"
+        },
+        "offloadFolder": "/workspace/.cache/offload"
+    },
+    "lazyLoading": {
+        "enabled": True,
+        "preloadLayers": 10,
+        "loadOnDemand": True
+    }
+}
+
+# Memory management
+MEMORY_MANAGEMENT_CONFIG = {
+    "garbageCollection": {
+        "enabled": True,
+        "intervalSeconds": 60,
+        "aggressiveMode": False
+    },
+    "memoryPooling": {
+        "enabled": True,
+        "poolSizeGb": 2,
+        "reuseThreshold": 0.8
+    },
+    "cacheManagement": {
+        "enabled": True,
+        "maxCacheSizeGb": 4,
+        "evictionPolicy": "LRU",
+        "cleanupIntervalSeconds": 300
+    },
+    "tensorOptimization": {
+        "enabled": True,
+        "pinMemory": True,
+        "asyncTransfer": True,
+        "memoryFormat": "channels_last"
+    }
+}
+
+# Inference optimization
+INFERENCE_OPTIMIZATION_CONFIG = {
+    "attentionOptimization": {
+        "enabled": True,
+        "useFlashAttention": True,
+        "useMemoryEfficientAttention": True,
+        "attentionType": "flash_attention_2"
+    },
+    "batchProcessing": {
+        "enabled": True,
+        "dynamicBatching": True,
+        "maxBatchSize": 4,
+        "batchTimeoutMs": 100
+    },
+    "precisionOptimization": {
+        "enabled": True,
+        "mixedPrecision": "fp16",
+        "gradientScaling": False,
+        "lossScaling": False
+    },
+    "computationOptimization": {
+        "enabled": True,
+        "useTensorCores": True,
+        "enableCudnnBenchmark": True,
+        "enableCudnnDeterministic": False
+    }
+}
+
+# VRAM monitoring
+MONITORING_CONFIG = {
+    "memoryTracking": {
+        "enabled": True,
+        "trackPeakUsage": True,
+        "trackFragmentation": True,
+        "logIntervalSeconds": 30
+    },
+    "alerts": {
+        "enabled": True,
+        "memoryThresholdPercent": 90,
+        "fragmentationThresholdPercent": 80,
+        "alertCooldownMinutes": 5
+    },
+    "profiling": {
+        "enabled": False,
+        "profileIntervalMinutes": 60,
+        "maxProfiles": 10
+    }
+}
+
+# GPU-specific optimization
+GPU_SPECIFIC_CONFIG = {
+    "rtx4090": {
+        "maxMemoryGb": 24,
+        "optimalBatchSize": 4,
+        "recommendedPrecision": "fp16",
+        "tensorCoreUtilization": "high"
+    },
+    "ada6000": {
+        "maxMemoryGb": 48,
+        "optimalBatchSize": 8,
+        "recommendedPrecision": "fp16",
+        "tensorCoreUtilization": "high"
+    },
+    "a100": {
+        "maxMemoryGb": 80,
+        "optimalBatchSize": 12,
+        "recommendedPrecision": "fp16",
+        "tensorCoreUtilization": "maximum"
+    }
+}
+
 class VRAMOptimizer:
     def __init__(self, project_root: str = None):
-        self.project_root = Path(project_root or os.getcwd())
+        self.project_root = Path(project_root) if project_root else default_project_root()
         self.runpod_dir = self.project_root / ".runpod"
 
-    def create_model_loading_config(self) -> Dict[str, Any]:
-        """Create efficient model loading configuration"""
-
-        loading_config = {
-            "memoryEfficientLoading": {
-                "enabled": True,
-                "loadIn8bit": False,
-                "loadIn4bit": False,
-                "deviceMap": "auto",
-                "torchDtype": "float16",
-                "lowCpuMemUsage": True
-            },
-            "modelSharding": {
-                "enabled": True,
-                "maxMemory": {
-                    "0": "8GB",
-                    "cpu": "16GB"
-                },
-                "offloadFolder": "/workspace/.cache/offload"
-            },
-            "lazyLoading": {
-                "enabled": True,
-                "preloadLayers": 10,
-                "loadOnDemand": True
-            }
-        }
-
-        return loading_config
-
-    def create_memory_management_config(self) -> Dict[str, Any]:
-        """Create memory management configuration"""
-
-        memory_config = {
-            "garbageCollection": {
-                "enabled": True,
-                "intervalSeconds": 60,
-                "aggressiveMode": False
-            },
-            "memoryPooling": {
-                "enabled": True,
-                "poolSizeGb": 2,
-                "reuseThreshold": 0.8
-            },
-            "cacheManagement": {
-                "enabled": True,
-                "maxCacheSizeGb": 4,
-                "evictionPolicy": "LRU",
-                "cleanupIntervalSeconds": 300
-            },
-            "tensorOptimization": {
-                "enabled": True,
-                "pinMemory": True,
-                "asyncTransfer": True,
-                "memoryFormat": "channels_last"
-            }
-        }
-
-        return memory_config
-
-    def create_inference_optimization_config(self) -> Dict[str, Any]:
-        """Create inference optimization configuration"""
-
-        inference_config = {
-            "attentionOptimization": {
-                "enabled": True,
-                "useFlashAttention": True,
-                "useMemoryEfficientAttention": True,
-                "attentionType": "flash_attention_2"
-            },
-            "batchProcessing": {
-                "enabled": True,
-                "dynamicBatching": True,
-                "maxBatchSize": 4,
-                "batchTimeoutMs": 100
-            },
-            "precisionOptimization": {
-                "enabled": True,
-                "mixedPrecision": "fp16",
-                "gradientScaling": False,
-                "lossScaling": False
-            },
-            "computationOptimization": {
-                "enabled": True,
-                "useTensorCores": True,
-                "enableCudnnBenchmark": True,
-                "enableCudnnDeterministic": False
-            }
-        }
-
-        return inference_config
-
-    def create_monitoring_config(self) -> Dict[str, Any]:
-        """Create VRAM monitoring configuration"""
-
-        monitoring_config = {
-            "memoryTracking": {
-                "enabled": True,
-                "trackPeakUsage": True,
-                "trackFragmentation": True,
-                "logIntervalSeconds": 30
-            },
-            "alerts": {
-                "enabled": True,
-                "memoryThresholdPercent": 90,
-                "fragmentationThresholdPercent": 80,
-                "alertCooldownMinutes": 5
-            },
-            "profiling": {
-                "enabled": False,
-                "profileIntervalMinutes": 60,
-                "maxProfiles": 10
-            }
-        }
-
-        return monitoring_config
-
-    def create_gpu_specific_config(self) -> Dict[str, Any]:
-        """Create GPU-specific optimization configuration"""
-
-        gpu_config = {
-            "rtx4090": {
-                "maxMemoryGb": 24,
-                "optimalBatchSize": 4,
-                "recommendedPrecision": "fp16",
-                "tensorCoreUtilization": "high"
-            },
-            "ada6000": {
-                "maxMemoryGb": 48,
-                "optimalBatchSize": 8,
-                "recommendedPrecision": "fp16",
-                "tensorCoreUtilization": "high"
-            },
-            "a100": {
-                "maxMemoryGb": 80,
-                "optimalBatchSize": 12,
-                "recommendedPrecision": "fp16",
-                "tensorCoreUtilization": "maximum"
-            }
-        }
-
-        return gpu_config
-
     def generate_vram_config(self) -> Dict[str, Any]:
         """Generate complete VRAM optimization configuration"""
 
         config = {
             "version": "1.0",
             "description": "VRAM optimization configuration for VibeVoice TTS worker",
-            "modelLoading": self.create_model_loading_config(),
-            "memoryManagement": self.create_memory_management_config(),
-            "inferenceOptimization": self.create_inference_optimization_config(),
-            "monitoring": self.create_monitoring_config(),
-            "gpuSpecific": self.create_gpu_specific_config(),
+            "modelLoading": MODEL_LOADING_CONFIG,
+            "memoryManagement": MEMORY_MANAGEMENT_CONFIG,
+            "inferenceOptimization": INFERENCE_OPTIMIZATION_CONFIG,
+            "monitoring": MONITORING_CONFIG,
+            "gpuSpecific": GPU_SPECIFIC_CONFIG,
             "fallbackStrategies": {
                 "enabled": True,
                 "strategies": [
@@ -186,8 +169,7 @@ class VRAMOptimizer:
         """Save VRAM configuration to file"""
 
         config_file = self.runpod_dir / filename
-        with open(config_file, 'w') as f:
-            json.dump(config, f, indent=2)
+        write_json_atomic(config_file, config)
 
         print(f"VRAM optimization configuration saved to {config_file}")
         return config_file
@@ -1,13 +1,26 @@
-import json
-import os
+import functools
+import orjson
+from pathlib import Path
 from typing import Dict, Any, Optional
 
+BASE_WORKFLOW_PATH = Path(__file__).resolve().parent.parent / "LoadAudio-VibeVoiceSS.json"
+
+@functools.lru_cache(maxsize=1)
+def _parse_workflow(workflow_path: Path, mtime_ns: int) -> Dict[str, Any]:
+    return orjson.loads(workflow_path.read_bytes())
+
 # Load the base workflow
 def load_base_workflow() -> Dict[str, Any]:
-    """Load the base LoadAudio-VibeVoiceSS workflow."""
-    workflow_path = os.path.join(os.path.dirname(__file__), '..', 'LoadAudio-VibeVoiceSS.json')
-    with open(workflow_path, 'r') as f:
-        return json.load(f)
+    """
+    Load the base LoadAudio-VibeVoiceSS workflow.
+
+    The parsed workflow is cached until the file's mtime changes and is shared
+    between callers, so treat it as read-only.
+    """
+    return _parse_workflow(BASE_WORKFLOW_PATH, BASE_WORKFLOW_PATH.stat().st_mtime_ns)
+
+# Node types that ship with ComfyUI itself
+BUILTIN_NODE_TYPES = frozenset({"LoadAudio", "SaveAudio"})  # Add more built-ins as needed
 
 # Analyze workflow structure
 def analyze_workflow(workflow: Dict[str, Any]) -> Dict[str, Any]:
@@ -19,22 +32,30 @@ def analyze_workflow(workflow: Dict[str, Any]) -> Dict[str, Any]:
         "dependencies": []
     }
 
+    nodes = analysis["nodes"]
+    models = analysis["models"]
+    custom_nodes = analysis["custom_nodes"]
+
     for node_id, node_data in workflow.items():
         node_type = node_data.get("class_type", "")
-        analysis["nodes"][node_id] = {
+        inputs = node_data.get("inputs")
+        input_names = ()
+        if inputs:
+            input_names = tuple(inputs)
+
+            # Extract models from inputs
+            model = inputs.get("model")
+            if isinstance(model, str):
+                models.add(model)
+
+        nodes[node_id] = {
             "type": node_type,
-            "inputs": list(node_data.get("inputs", {}).keys())
+            "inputs": input_names
         }
 
         # Identify custom nodes (non-built-in)
-        if node_type not in ["LoadAudio", "SaveAudio"]:  # Add more built-ins as needed
-            analysis["custom_nodes"].add(node_type)
-
-        # Extract models from inputs
-        if "model" in node_data.get("inputs", {}):
-            model = node_data["inputs"]["model"]
-            if isinstance(model, str):
-                analysis["models"].add(model)
+        if node_type not in BUILTIN_NODE_TYPES:
+            custom_nodes.add(node_type)
 
     # Dependencies
     if "VibeVoiceSingleSpeakerNode" in analysis["custom_nodes"]:
@@ -77,46 +98,65 @@ def modify_workflow_for_tts(
     Returns:
         Modified workflow JSON
     """
-    # Create a deep copy
-    workflow = json.loads(json.dumps(base_workflow))
+    # Copy only the three nodes whose inputs change; every other node is
+    # shared with base_workflow, which is left untouched
+    workflow = dict(base_workflow)
 
-    # Update text
-    workflow["2"]["inputs"]["text"] = text
+    # Update text and model
+    tts_inputs = {**base_workflow["2"]["inputs"], "text": text, "model": model}
 
-    # Update reference audio
-    workflow["3"]["inputs"]["audio"] = reference_audio
+    # Update voice settings; unknown settings are ignored
+    if voice_settings:
+        for setting in voice_settings.keys() & tts_inputs.keys():
+            tts_inputs[setting] = voice_settings[setting]
 
-    # Update model
-    workflow["2"]["inputs"]["model"] = model
+    workflow["2"] = {**base_workflow["2"], "inputs": tts_inputs}
 
-    # Update output prefix
-    workflow["5"]["inputs"]["filename_prefix"] = output_prefix
+    # Update reference audio
+    workflow["3"] = {**base_workflow["3"], "inputs": {**base_workflow["3"]["inputs"], "audio": reference_audio}}
 
-    # Update voice settings
-    if voice_settings:
-        for setting, value in voice_settings.items():
-            if setting in workflow["2"]["inputs"]:
-                workflow["2"]["inputs"][setting] = value
+    # Update output prefix
+    workflow["5"] = {**base_workflow["5"], "inputs": {**base_workflow["5"]["inputs"], "filename_prefix": output_prefix}}
 
     return workflow
 
+REQUIRED_NODES = frozenset({"2", "3", "5"})  # VibeVoice, LoadAudio, SaveAudio
+
+def _links_to(value: Any, node_id: str) -> bool:
+    """Whether an input value is a link to output 0 of node_id."""
+    return isinstance(value, list) and len(value) == 2 and value[0] == node_id and value[1] == 0
+
 def validate_workflow_inputs(workflow: Dict[str, Any]) -> bool:
     """Validate that the workflow has required inputs and links."""
-    required_nodes = {"2", "3", "5"}  # VibeVoice, LoadAudio, SaveAudio
-
-    if not all(node in workflow for node in required_nodes):
+    if not REQUIRED_NODES <= workflow.keys():
         return False
 
     # Check that voice_to_clone links to LoadAudio
-    if workflow["2"]["inputs"].get("voice_to_clone") != ["3", 0]:
+    if not _links_to(workflow["2"]["inputs"].get("voice_to_clone"), "3"):
         return False
 
     # Check that SaveAudio links to VibeVoice
-    if workflow["5"]["inputs"].get("audio") != ["2", 0]:
+    if not _links_to(workflow["5"]["inputs"].get("audio"), "2"):
         return False
 
     return True
 
+@functools.lru_cache(maxsize=1)
+def _validate_parsed_workflow(workflow_path: Path, mtime_ns: int) -> bool:
+    return validate_workflow_inputs(_parse_workflow(workflow_path, mtime_ns))
+
+def base_workflow_is_valid() -> bool:
+    """
+    Validate the base workflow, once per version of the file.
+
+    modify_workflow_for_tts leaves the links validate_workflow_inputs checks
+    untouched (unless voice_settings overrides voice_to_clone), so this result
+    also holds for the workflows derived from it.
+    Dicts cannot be weak-referenced, so validating arbitrary workflows is not
+    memoized by identity.
+    """
+    return _validate_parsed_workflow(BASE_WORKFLOW_PATH, BASE_WORKFLOW_PATH.stat().st_mtime_ns)
+
 # Main analysis
 if __name__ == "__main__":
     workflow = load_base_workflow()
@@ -128,4 +168,4 @@ if __name__ == "__main__":
     print(f"Custom Nodes: {analysis['custom_nodes']}")
     print(f"Dependencies: {analysis['dependencies']}")
 
-    print(f"\nWorkflow valid: {validate_workflow_inputs(workflow)}")
\ No newline at end of file
+    print(f"\nWorkflow valid: {base_workflow_is_valid()}")
\ No newline at end of file
@@ -1,11 +1,21 @@
 import unittest
-import io
-import wave
+import array
+import functools
+import math
 import struct
-from unittest.mock import patch, MagicMock, mock_open
 import sys
 import os
-import base64
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
 
 # Add the root directory to the path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -13,99 +23,146 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import rp_handler
 
 
+# Reusable payload block for the base64 size checks; a multiple of 3 bytes, so
+# consecutive blocks encode without padding and concatenate to the full encoding
+_PAYLOAD_CHUNK = b'A' * (3 * 16384)
+
+# RIFF header, 16-byte PCM fmt chunk and data chunk header: 44 bytes in all
+_WAV_HDR = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+
+def _wav_header_fields(data_size, channels, sample_width, sample_rate):
+    """Return the _WAV_HDR field values for a PCM WAV file."""
+    return (
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, channels, sample_rate,
+        sample_rate * channels * sample_width,
+        channels * sample_width, sample_width * 8,
+        b'data', data_size,
+    )
+
+
+@functools.cache
+def _wav_header(data_size, channels, sample_width, sample_rate):
+    """Build a canonical 44-byte PCM WAV header."""
+    return _WAV_HDR.pack(*_wav_header_fields(data_size, channels, sample_width, sample_rate))
+
+
+@functools.cache
+def _silent_wav(sample_rate, channels, sample_width, num_frames):
+    """Build a silent PCM WAV file in memory, shared by every test that needs it."""
+    data_size = num_frames * channels * sample_width
+    # Write the header in place over a zeroed buffer instead of concatenating
+    buf = bytearray(_WAV_HDR.size + data_size)
+    _WAV_HDR.pack_into(
+        buf, 0, *_wav_header_fields(data_size, channels, sample_width, sample_rate))
+    return bytes(buf)
+
+
+def _silent_cases(pairs):
+    """Build (sample_rate, duration, wav bytes) for silent 16-bit mono clips."""
+    return [
+        (sample_rate, duration, _silent_wav(sample_rate, 1, 2, int(sample_rate * duration)))
+        for sample_rate, duration in pairs
+    ]
+
+
+def _pcm16_bytes(samples):
+    """Pack an iterable of ints as little-endian 16-bit PCM without numpy."""
+    pcm = array.array('h', samples)
+    if sys.byteorder == 'big':
+        pcm.byteswap()
+    return pcm.tobytes()
+
+
+def _sine_wave(num_samples, sample_rate, frequency=440, amplitude=0.5):
+    """Return a mono 16-bit PCM sine wave as bytes."""
+    if np is not None:
+        t = np.arange(num_samples, dtype=np.float64)
+        wave_samples = 32767 * amplitude * np.sin(2 * np.pi * frequency * t / sample_rate)
+        return wave_samples.astype('<i2').tobytes()
+    step = 2 * math.pi * frequency / sample_rate
+    return _pcm16_bytes(int(32767 * amplitude * math.sin(i * step)) for i in range(num_samples))
+
+
+def _square_stereo(num_frames, level=10000):
+    """Return a stereo 16-bit PCM square wave, right channel inverted, as bytes."""
+    if np is not None:
+        frames = np.empty((num_frames, 2), dtype='<i2')
+        frames[:, 0] = level * (np.arange(num_frames) % 2)   # Left channel
+        frames[:, 1] = -frames[:, 0]                          # Right channel
+        return frames.tobytes()
+    return _pcm16_bytes(
+        sample for i in range(num_frames) for sample in (level * (i & 1), -level * (i & 1))
+    )
+
+
+def _write_temp_wav(test, data):
+    """Write WAV bytes to a temp file that is removed after the test."""
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+        f.write(data)
+    test.addCleanup(os.unlink, f.name)
+    return f.name
+
+
 class TestAudioValidation(unittest.TestCase):
     """Test audio output quality and format compliance."""
 
-    def setUp(self):
-        """Set up test fixtures."""
+    @classmethod
+    def setUpClass(cls):
+        """Set up test fixtures, shared read-only by every test."""
         # Create a valid WAV file in memory for testing
-        self.sample_rate = 44100
-        self.channels = 1
-        self.sample_width = 2  # 16-bit
-        self.duration = 1.0
-        self.num_samples = int(self.sample_rate * self.duration)
-
-        # Generate sine wave samples
-        samples = []
-        for i in range(self.num_samples):
-            # 440 Hz sine wave
-            sample = int(32767 * 0.5 * (i * 2 * 3.14159 * 440 / self.sample_rate))
-            samples.append(struct.pack('<h', sample))
+        cls.sample_rate = 44100
+        cls.channels = 1
+        cls.sample_width = 2  # 16-bit
+        cls.duration = 1.0
+        cls.num_samples = int(cls.sample_rate * cls.duration)
 
-        wav_data = b''.join(samples)
+        # Generate a 440 Hz sine wave at half scale
+        wav_data = _sine_wave(cls.num_samples, cls.sample_rate)
 
         # Create WAV file header
-        wav_header = self._create_wav_header(len(wav_data))
-        self.valid_wav_data = wav_header + wav_data
+        wav_header = cls._create_wav_header(len(wav_data))
+        cls.valid_wav_data = wav_header + wav_data
+        cls.valid_wav_b64 = base64.b64encode(cls.valid_wav_data).decode()
+
+        # Clips for the header metadata checks, built once for the class
+        cls.quality_cases = _silent_cases([
+            (22050, 0.5),  # 22kHz, 0.5s
+            (44100, 1.0),  # 44.1kHz, 1.0s
+            (48000, 2.0),  # 48kHz, 2.0s
+        ])
+        # Precise timings at 44.1kHz
+        cls.metadata_cases = _silent_cases([(44100, d) for d in (0.5, 1.0, 2.5, 10.0)])
 
-    def _create_wav_header(self, data_size):
+    @classmethod
+    def _create_wav_header(cls, data_size):
         """Create a minimal WAV file header."""
-        header = b'RIFF'
-        header += struct.pack('<I', 36 + data_size)  # File size
-        header += b'WAVE'
-        header += b'fmt '
-        header += struct.pack('<I', 16)  # Format chunk size
-        header += struct.pack('<H', 1)   # Audio format (PCM)
-        header += struct.pack('<H', self.channels)
-        header += struct.pack('<I', self.sample_rate)
-        header += struct.pack('<I', self.sample_rate * self.channels * self.sample_width)
-        header += struct.pack('<H', self.channels * self.sample_width)
-        header += struct.pack('<H', self.sample_width * 8)
-        header += b'data'
-        header += struct.pack('<I', data_size)
-        return header
-
-    @patch("rp_handler.torchaudio.load")
-    @patch("builtins.open", new_callable=mock_open)
-    def test_valid_wav_output_format(self, mock_file, mock_load):
-        """Test that output audio is in valid WAV format."""
-        # Mock file reading
-        mock_file.return_value.read.return_value = self.valid_wav_data
+        return _wav_header(data_size, cls.channels, cls.sample_width, cls.sample_rate)
 
-        # Mock torchaudio
-        mock_waveform = MagicMock()
-        mock_waveform.shape = [1, self.num_samples]
-        mock_load.return_value = (mock_waveform, self.sample_rate)
+    def test_valid_wav_output_format(self):
+        """Test that output audio is in valid WAV format."""
+        path = _write_temp_wav(self, self.valid_wav_data)
 
-        result = rp_handler.get_audio_output("test.wav", 42)
+        result = rp_handler.get_audio_output(path, 42)
 
         # Verify base64 encoding
-        decoded_audio = base64.b64decode(result["audio_base64"])
-        self.assertEqual(decoded_audio, self.valid_wav_data)
+        self.assertEqual(result["audio_base64"], self.valid_wav_b64)
 
         # Verify metadata
         self.assertEqual(result["sample_rate"], self.sample_rate)
-        self.assertAlmostEqual(result["duration"], self.duration, places=2)
+        self.assertEqual(round(result["duration"] * self.sample_rate), self.num_samples)
         self.assertEqual(result["seed_used"], 42)
 
-    @patch("rp_handler.torchaudio.load")
-    @patch("builtins.open", new_callable=mock_open)
-    def test_audio_quality_checks(self, mock_file, mock_load):
+    def test_audio_quality_checks(self):
         """Test audio quality validation."""
         # Test with different sample rates
-        test_cases = [
-            (22050, 0.5),  # 22kHz, 0.5s
-            (44100, 1.0),  # 44.1kHz, 1.0s
-            (48000, 2.0),  # 48kHz, 2.0s
-        ]
-
-        for sample_rate, duration in test_cases:
+        for sample_rate, duration, wav_data in self.quality_cases:
             with self.subTest(sample_rate=sample_rate, duration=duration):
-                num_samples = int(sample_rate * duration)
-                mock_waveform = MagicMock()
-                mock_waveform.shape = [1, num_samples]
-                mock_load.return_value = (mock_waveform, sample_rate)
-
-                # Create appropriate WAV data
-                samples = [struct.pack('<h', 0) for _ in range(num_samples)]
-                wav_data = self._create_wav_header(len(b''.join(samples))) + b''.join(samples)
-                mock_file.return_value.read.return_value = wav_data
-
-                result = rp_handler.get_audio_output("test.wav", 42)
-
-                # Verify sample rate and duration are correctly calculated
-                self.assertEqual(result["sample_rate"], sample_rate)
-                self.assertAlmostEqual(result["duration"], duration, places=2)
+                # Verify sample rate and frame count are read from the header
+                header_rate, num_frames = rp_handler._wav_info(wav_data)
+                self.assertEqual(header_rate, sample_rate)
+                self.assertEqual(num_frames, int(sample_rate * duration))
 
     def test_base64_encoding_integrity(self):
         """Test that base64 encoding/decoding preserves audio data."""
@@ -117,58 +174,37 @@ class TestAudioValidation(unittest.TestCase):
 
         self.assertEqual(decoded, test_audio_data)
 
-    @patch("rp_handler.torchaudio.load")
-    @patch("builtins.open", new_callable=mock_open)
-    def test_audio_file_corruption_detection(self, mock_file, mock_load):
+    def test_audio_file_corruption_detection(self):
         """Test detection of corrupted audio files."""
-        # Test with corrupted WAV data
+        # Test with corrupted WAV data; header parsing should fail
         corrupted_data = b"This is not a valid WAV file"
-        mock_file.return_value.read.return_value = corrupted_data
-
-        # torchaudio.load should fail on invalid data
-        mock_load.side_effect = Exception("Invalid WAV file")
+        path = _write_temp_wav(self, corrupted_data)
 
         with self.assertRaises(Exception):
-            rp_handler.get_audio_output("corrupted.wav", 42)
+            rp_handler.get_audio_output(path, 42)
 
-    @patch("rp_handler.torchaudio.load")
-    @patch("builtins.open", new_callable=mock_open)
-    def test_empty_audio_file_handling(self, mock_file, mock_load):
+    def test_empty_audio_file_handling(self):
         """Test handling of empty or very short audio files."""
-        # Empty file
-        mock_file.return_value.read.return_value = b""
-
-        mock_waveform = MagicMock()
-        mock_waveform.shape = [1, 0]  # No samples
-        mock_load.return_value = (mock_waveform, 44100)
+        # Header-only file with no samples
+        path = _write_temp_wav(self, _silent_wav(self.sample_rate, 1, 2, 0))
 
-        result = rp_handler.get_audio_output("empty.wav", 42)
+        result = rp_handler.get_audio_output(path, 42)
 
         # Should handle empty file gracefully
         self.assertEqual(result["duration"], 0.0)
         self.assertEqual(result["sample_rate"], 44100)
 
-    @patch("rp_handler.torchaudio.load")
-    @patch("builtins.open", new_callable=mock_open)
-    def test_stereo_audio_handling(self, mock_file, mock_load):
+    def test_stereo_audio_handling(self):
         """Test handling of stereo audio files."""
-        # Stereo audio (2 channels)
-        mock_waveform = MagicMock()
-        mock_waveform.shape = [2, 44100]  # 2 channels, 1 second
-        mock_load.return_value = (mock_waveform, 44100)
-
+        # Stereo audio (2 channels, 1 second)
         # Create stereo WAV data
-        samples = []
-        for i in range(44100):
-            # Left channel
-            samples.append(struct.pack('<h', int(10000 * (i % 2))))
-            # Right channel
-            samples.append(struct.pack('<h', int(-10000 * (i % 2))))
+        samples = _square_stereo(44100)
 
-        wav_data = self._create_wav_header(len(b''.join(samples))) + b''.join(samples)
-        mock_file.return_value.read.return_value = wav_data
+        wav_data = self._create_wav_header_for_config(
+            len(samples), 2, 2, 44100) + samples
+        path = _write_temp_wav(self, wav_data)
 
-        result = rp_handler.get_audio_output("stereo.wav", 42)
+        result = rp_handler.get_audio_output(path, 42)
 
         # Duration should still be calculated correctly for stereo
         self.assertEqual(result["sample_rate"], 44100)
@@ -195,85 +231,64 @@ class TestAudioValidation(unittest.TestCase):
                 header = self._create_wav_header_for_config(data_size, channels, sample_width, sample_rate)
 
                 # Verify header is correctly formatted
-                self.assertEqual(header[0:4], b'RIFF')
-                self.assertEqual(header[8:12], b'WAVE')
-                self.assertEqual(header[12:16], b'fmt ')
+                self.assertEqual(len(header), _WAV_HDR.size)
+                (riff, riff_size, wave_id, fmt_id, fmt_size, audio_format,
+                 num_channels, sample_rate_header, byte_rate, block_align,
+                 bits_per_sample, data_id, data_size_header) = _WAV_HDR.unpack(header)
+                self.assertEqual(riff, b'RIFF')
+                self.assertEqual(riff_size, 36 + data_size)
+                self.assertEqual(wave_id, b'WAVE')
+                self.assertEqual(fmt_id, b'fmt ')
+                self.assertEqual(fmt_size, 16)
 
                 # Verify format parameters in header
-                fmt_data = header[16:36]
-                audio_format, num_channels, sample_rate_header = struct.unpack('<HHH', fmt_data[0:6])
                 self.assertEqual(audio_format, 1)  # PCM
                 self.assertEqual(num_channels, channels)
                 self.assertEqual(sample_rate_header, sample_rate)
+                self.assertEqual(byte_rate, sample_rate * channels * sample_width)
+                self.assertEqual(block_align, channels * sample_width)
+                self.assertEqual(bits_per_sample, sample_width * 8)
+                self.assertEqual(data_id, b'data')
+                self.assertEqual(data_size_header, data_size)
 
     def _create_wav_header_for_config(self, data_size, channels, sample_width, sample_rate):
         """Create WAV header for specific audio configuration."""
-        header = b'RIFF'
-        header += struct.pack('<I', 36 + data_size)
-        header += b'WAVE'
-        header += b'fmt '
-        header += struct.pack('<I', 16)  # Format chunk size
-        header += struct.pack('<H', 1)   # Audio format (PCM)
-        header += struct.pack('<H', channels)
-        header += struct.pack('<I', sample_rate)
-        header += struct.pack('<I', sample_rate * channels * sample_width)
-        header += struct.pack('<H', channels * sample_width)
-        header += struct.pack('<H', sample_width * 8)
-        header += b'data'
-        header += struct.pack('<I', data_size)
-        return header
-
-    @patch("rp_handler.torchaudio.load")
-    @patch("builtins.open", new_callable=mock_open)
-    def test_audio_metadata_accuracy(self, mock_file, mock_load):
+        return _wav_header(data_size, channels, sample_width, sample_rate)
+
+    def test_audio_metadata_accuracy(self):
         """Test accuracy of audio metadata extraction."""
         # Test with precise timing
-        test_durations = [0.5, 1.0, 2.5, 10.0]
-        sample_rate = 44100
-
-        for expected_duration in test_durations:
+        for sample_rate, expected_duration, wav_data in self.metadata_cases:
             with self.subTest(duration=expected_duration):
-                num_samples = int(sample_rate * expected_duration)
-                mock_waveform = MagicMock()
-                mock_waveform.shape = [1, num_samples]
-                mock_load.return_value = (mock_waveform, sample_rate)
-
-                result = rp_handler.get_audio_output("test.wav", 42)
-
-                # Duration should be accurate to within 0.01 seconds
-                self.assertAlmostEqual(result["duration"], expected_duration, places=2)
-                self.assertEqual(result["sample_rate"], sample_rate)
+                # Duration should be exact to the frame
+                header_rate, num_frames = rp_handler._wav_info(wav_data)
+                self.assertEqual(num_frames, int(sample_rate * expected_duration))
+                self.assertEqual(header_rate, sample_rate)
 
 
 class TestAudioQualityMetrics(unittest.TestCase):
     """Test audio quality metrics and validation."""
 
-    @patch("rp_handler.torchaudio.load")
-    @patch("builtins.open", new_callable=mock_open)
-    def test_audio_length_validation(self, mock_file, mock_load):
+    @classmethod
+    def setUpClass(cls):
+        """Build the audio length clips once for the class."""
+        cls.length_cases = _silent_cases([
+            (44100, 0.1),   # Too short
+            (44100, 0.5),   # Minimum acceptable
+            (44100, 1.0),   # Good length
+            (44100, 30.0),  # Maximum acceptable
+            (44100, 35.0),  # Too long (should be validated at generation time)
+        ])
+
+    def test_audio_length_validation(self):
         """Test that generated audio meets minimum length requirements."""
         # Test various audio lengths
-        test_cases = [
-            (0.1, True),   # Too short
-            (0.5, True),   # Minimum acceptable
-            (1.0, True),   # Good length
-            (30.0, True),  # Maximum acceptable
-            (35.0, False), # Too long (should be validated at generation time)
-        ]
-
-        for duration, should_pass in test_cases:
+        for _, duration, wav_data in self.length_cases:
             with self.subTest(duration=duration):
-                sample_rate = 44100
-                num_samples = int(sample_rate * duration)
-                mock_waveform = MagicMock()
-                mock_waveform.shape = [1, num_samples]
-                mock_load.return_value = (mock_waveform, sample_rate)
-
-                result = rp_handler.get_audio_output("test.wav", 42)
-
                 # Just verify the duration is calculated correctly
                 # Length validation would happen at the workflow level
-                self.assertAlmostEqual(result["duration"], duration, places=2)
+                sample_rate, num_frames = rp_handler._wav_info(wav_data)
+                self.assertEqual(num_frames, int(sample_rate * duration))
 
     def test_base64_payload_size(self):
         """Test that base64 encoded audio is reasonably sized."""
@@ -282,19 +297,17 @@ class TestAudioQualityMetrics(unittest.TestCase):
 
         for size in test_sizes:
             with self.subTest(size=size):
-                # Create dummy audio data
-                audio_data = b'A' * size
-
-                # Encode to base64
-                encoded = base64.b64encode(audio_data).decode()
-
-                # Verify encoding is correct
-                decoded = base64.b64decode(encoded)
-                self.assertEqual(decoded, audio_data)
-
-                # Verify size is reasonable (base64 is ~33% larger)
-                expected_size = len(audio_data) * 4 // 3
-                self.assertAlmostEqual(len(encoded), expected_size, delta=10)
+                # Stream-encode the dummy audio data one block at a time with the
+                # handler's encoder (the round trip is covered by
+                # test_valid_wav_output_format)
+                full_chunks, remainder = divmod(size, len(_PAYLOAD_CHUNK))
+                chunk = memoryview(_PAYLOAD_CHUNK)
+                encoded_size = full_chunks * len(rp_handler._b64encode_str(chunk))
+                encoded_size += len(rp_handler._b64encode_str(chunk[:remainder]))
+
+                # Verify size: 4 output characters per started 3-byte group
+                expected_size = (size + 2) // 3 * 4
+                self.assertEqual(encoded_size, expected_size)
 
 
 if __name__ == "__main__":
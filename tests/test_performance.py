@@ -1,6 +1,10 @@
 import unittest
+import io
 import time
 import asyncio
+import tempfile
+import wave
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock
 import sys
 import os
@@ -11,11 +15,56 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import rp_handler
 
 
-class TestPerformanceBenchmarking(unittest.TestCase):
+class FakeClock:
+    """Stand-in for time.time that only moves when a test advances it."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class MockedPipelineTestCase(unittest.TestCase):
+    """Base class that replaces the handler's pipeline stages with mocks.
+
+    The patches are started once per class; setUp only resets the mocks and
+    restores their default return values.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        for name in ("process_reference_audio", "_preconnect", "modify_workflow",
+                     "execute_workflow", "get_audio_output"):
+            patcher = patch(f"rp_handler.{name}")
+            setattr(cls, f"mock_{name.lstrip('_')}", patcher.start())
+            cls.addClassCleanup(patcher.stop)
+
+    def setUp(self):
+        for mock in (self.mock_process_reference_audio, self.mock_preconnect,
+                     self.mock_modify_workflow, self.mock_execute_workflow,
+                     self.mock_get_audio_output):
+            mock.reset_mock(return_value=True, side_effect=True)
+        self.mock_process_reference_audio.return_value = "input/maya.wav"
+        self.mock_modify_workflow.return_value = {"test": "workflow"}
+        self.mock_execute_workflow.return_value = "output/test.wav"
+        self.mock_get_audio_output.return_value = {
+            "audio_base64": "dGVzdA==",  # base64 "test"
+            "duration": 1.0,
+            "sample_rate": 44100,
+            "seed_used": 42
+        }
+
+
+class TestPerformanceBenchmarking(MockedPipelineTestCase):
     """Performance tests for cold start and generation times."""
 
     def setUp(self):
         """Set up test fixtures."""
+        super().setUp()
         self.test_event = {
             "input": {
                 "text": "This is a test sentence for performance benchmarking.",
@@ -25,22 +74,9 @@ class TestPerformanceBenchmarking(unittest.TestCase):
             }
         }
 
-    @patch("rp_handler.process_reference_audio")
-    @patch("rp_handler.modify_workflow")
-    @patch("rp_handler.execute_workflow")
-    @patch("rp_handler.get_audio_output")
-    def test_generation_time_benchmark(self, mock_get_output, mock_execute, mock_modify, mock_process_audio):
+    def test_generation_time_benchmark(self):
         """Test that audio generation completes within 10 seconds."""
-        # Setup mocks
-        mock_process_audio.return_value = "input/maya.wav"
-        mock_modify.return_value = {"test": "workflow"}
-        mock_execute.return_value = "output/test.wav"
-        mock_get_output.return_value = {
-            "audio_base64": "dGVzdA==",  # base64 "test"
-            "duration": 2.5,
-            "sample_rate": 44100,
-            "seed_used": 42
-        }
+        self.mock_get_audio_output.return_value["duration"] = 2.5
 
         # Measure execution time
         start_time = time.time()
@@ -57,34 +93,21 @@ class TestPerformanceBenchmarking(unittest.TestCase):
         self.assertIn("audio_base64", result)
         self.assertIn("duration", result)
 
-    @patch("rp_handler.process_reference_audio")
-    @patch("rp_handler.modify_workflow")
-    @patch("rp_handler.execute_workflow")
-    @patch("rp_handler.get_audio_output")
-    def test_cold_start_time_benchmark(self, mock_get_output, mock_execute, mock_modify, mock_process_audio):
+    def test_cold_start_time_benchmark(self):
         """Test cold start time (first request after initialization)."""
-        # Setup mocks
-        mock_process_audio.return_value = "input/maya.wav"
-        mock_modify.return_value = {"test": "workflow"}
-        mock_execute.return_value = "output/test.wav"
-        mock_get_output.return_value = {
-            "audio_base64": "dGVzdA==",
-            "duration": 1.0,
-            "sample_rate": 44100,
-            "seed_used": 42
-        }
+        clock = FakeClock()
 
         # Simulate cold start by adding small delay to workflow execution
-        original_execute = mock_execute
         def delayed_execute(workflow):
-            time.sleep(0.1)  # Simulate cold start overhead
+            clock.sleep(0.1)  # Simulate cold start overhead
             return "output/test.wav"
-        mock_execute.side_effect = delayed_execute
+        self.mock_execute_workflow.side_effect = delayed_execute
 
         # Measure cold start time
-        start_time = time.time()
-        result = rp_handler.handler(self.test_event)
-        end_time = time.time()
+        with patch("time.time", clock.time):
+            start_time = time.time()
+            result = rp_handler.handler(self.test_event)
+            end_time = time.time()
 
         cold_start_time = end_time - start_time
 
@@ -92,6 +115,10 @@ class TestPerformanceBenchmarking(unittest.TestCase):
         self.assertLess(cold_start_time, 30.0,
                        f"Cold start time {cold_start_time:.2f}s exceeded 30s limit")
 
+
+class TestComponentPerformance(unittest.TestCase):
+    """Performance tests for individual handler stages, run unmocked."""
+
     def test_parameter_ranges_performance(self):
         """Test that parameter validation is fast."""
         test_cases = [
@@ -100,58 +127,73 @@ class TestPerformanceBenchmarking(unittest.TestCase):
             {"text": "A" * 1000, "temperature": 1.0, "speed": 1.0, "seed": 500000},
         ]
 
+        iterations = 1000
+
+        # Construct one request up front so one-off validator setup is not timed
+        rp_handler.TTSRequest(**test_cases[0])
+
         for i, params in enumerate(test_cases):
             with self.subTest(case=i):
-                start_time = time.time()
-                try:
-                    request = rp_handler.TTSRequest(**params)
-                    validation_time = time.time() - start_time
-                    # Validation should be very fast (< 0.01s)
-                    self.assertLess(validation_time, 0.01,
-                                   f"Validation too slow: {validation_time:.4f}s")
-                except ValueError:
-                    # Expected for invalid parameters, but timing still matters
-                    validation_time = time.time() - start_time
-                    self.assertLess(validation_time, 0.01,
-                                   f"Validation too slow: {validation_time:.4f}s")
-
-    @patch("rp_handler.requests.get")
+                start_time = time.perf_counter()
+                for _ in range(iterations):
+                    try:
+                        rp_handler.TTSRequest(**params)
+                    except ValueError:
+                        # Expected for invalid parameters, but timing still matters
+                        pass
+                validation_time = (time.perf_counter() - start_time) / iterations
+
+                # Validation should be very fast (< 0.01s per request)
+                self.assertLess(validation_time, 0.01,
+                               f"Validation too slow: {validation_time:.6f}s")
+
+    @patch("rp_handler._REF_CACHE_DIR", None)
+    @patch("rp_handler._SESSION.get")
     def test_network_timeout_performance(self, mock_get):
         """Test that network operations have reasonable timeouts."""
-        # Mock a slow response
+        # Mock a slow streamed response
         mock_response = MagicMock()
-        mock_response.content = b"audio_data"
+        mock_response.raw = io.BytesIO(b"audio_data")
         mock_response.raise_for_status.return_value = None
+        clock = FakeClock()
 
-        def slow_get(url):
-            time.sleep(1.0)  # Simulate network delay
-            return mock_response
+        def slow_get(url, **kwargs):
+            clock.sleep(1.0)  # Simulate network delay
+            request = MagicMock()
+            request.__enter__.return_value = mock_response
+            return request
 
         mock_get.side_effect = slow_get
 
-        start_time = time.time()
-        try:
-            rp_handler.process_reference_audio("http://example.com/audio.wav")
-        except Exception:
-            pass  # Expected due to mocking
-        network_time = time.time() - start_time
+        with patch("time.time", clock.time):
+            start_time = time.time()
+            path = rp_handler.process_reference_audio("http://example.com/audio.wav")
+            network_time = time.time() - start_time
+        self.addCleanup(os.unlink, path)
+
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"audio_data")
+        self.assertEqual(mock_get.call_args.kwargs["timeout"], rp_handler.HTTP_TIMEOUT)
 
         # Network operations should complete reasonably fast
-        # In real implementation, we'd want timeouts, but for testing we check the operation doesn't hang
         self.assertLess(network_time, 5.0,
                        f"Network operation took too long: {network_time:.2f}s")
 
-    @patch("rp_handler.torchaudio.load")
-    @patch("builtins.open", new_callable=lambda: MagicMock())
-    def test_audio_processing_performance(self, mock_file, mock_load):
+    def test_audio_processing_performance(self):
         """Test audio processing performance."""
-        # Mock audio data
-        mock_waveform = MagicMock()
-        mock_waveform.shape = [1, 88200]  # 2 seconds at 44100 Hz
-        mock_load.return_value = (mock_waveform, 44100)
+        # 2 seconds of silent 16-bit mono audio at 44100 Hz
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(44100)
+            wav.writeframes(b"\x00" * (88200 * 2))
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+            f.write(buf.getvalue())
+        self.addCleanup(os.unlink, f.name)
 
         start_time = time.time()
-        result = rp_handler.get_audio_output("test.wav", 42)
+        result = rp_handler.get_audio_output(f.name, 42)
         processing_time = time.time() - start_time
 
         # Audio processing should be fast
@@ -165,27 +207,18 @@ class TestPerformanceBenchmarking(unittest.TestCase):
         self.assertIn("seed_used", result)
 
 
-class TestLoadTesting(unittest.TestCase):
+class TestLoadTesting(MockedPipelineTestCase):
     """Load testing for concurrent requests."""
 
-    @patch("rp_handler.process_reference_audio")
-    @patch("rp_handler.modify_workflow")
-    @patch("rp_handler.execute_workflow")
-    @patch("rp_handler.get_audio_output")
-    def test_concurrent_requests(self, mock_get_output, mock_execute, mock_modify, mock_process_audio):
+    def test_concurrent_requests(self):
         """Test handling multiple concurrent requests."""
-        # Setup mocks
-        mock_process_audio.return_value = "input/maya.wav"
-        mock_modify.return_value = {"test": "workflow"}
-        mock_execute.return_value = "output/test.wav"
-        mock_get_output.return_value = {
-            "audio_base64": "dGVzdA==",
-            "duration": 1.0,
-            "sample_rate": 44100,
-            "seed_used": 42
-        }
+        # Keep each prompt in flight briefly so overlapping requests are measurable
+        async def busy_execute(workflow):
+            await asyncio.sleep(0.05)
+            return "output/test.wav"
+        self.mock_execute_workflow.side_effect = busy_execute
 
-        async def run_request(request_id):
+        def run_request(request_id):
             event = {
                 "input": {
                     "text": f"Test request {request_id}",
@@ -199,14 +232,10 @@ class TestLoadTesting(unittest.TestCase):
             end_time = time.time()
             return end_time - start_time, result
 
-        async def run_concurrent_test():
-            tasks = [run_request(i) for i in range(5)]  # 5 concurrent requests
-            results = await asyncio.gather(*tasks)
-            return results
-
-        # Run concurrent test
+        # Run concurrent test: 5 requests from separate worker threads
         start_time = time.time()
-        results = asyncio.run(run_concurrent_test())
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(run_request, range(5)))
         total_time = time.time() - start_time
 
         # All requests should complete within reasonable time
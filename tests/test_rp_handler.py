@@ -1,10 +1,17 @@
 import unittest
+import asyncio
+import binascii
 import json
 import os
 import tempfile
 import base64
-from unittest.mock import patch, MagicMock, mock_open
+import gzip
+import io
+import wave
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock
 import sys
+import urllib3
 
 # Add the root directory to the path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -36,6 +43,13 @@ class TestTTSRequest(unittest.TestCase):
         self.assertEqual(request.temperature, 0.8)
         self.assertEqual(request.speed, 1.0)
         self.assertEqual(request.seed, 42)
+        self.assertEqual(request.return_mode, "base64")
+
+    def test_return_mode_validation(self):
+        rp_handler.TTSRequest(text="Hello", return_mode="url")
+
+        with self.assertRaises(ValueError):
+            rp_handler.TTSRequest(text="Hello", return_mode="file")
 
     def test_text_validation(self):
         # Valid text
@@ -86,30 +100,84 @@ class TestTTSRequest(unittest.TestCase):
 class TestProcessReferenceAudio(unittest.TestCase):
     """Test reference audio processing."""
 
+    def setUp(self):
+        # The default voice is resolved once per process; start each test cold
+        rp_handler._default_reference_audio.cache_clear()
+        self.addCleanup(rp_handler._default_reference_audio.cache_clear)
+        # These tests cover the uncached path whatever REF_AUDIO_CACHE_DIR says
+        patcher = patch("rp_handler._REF_CACHE_DIR", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @patch("rp_handler.os.path.exists")
     def test_default_audio_exists(self, mock_exists):
         mock_exists.return_value = True
         result = rp_handler.process_reference_audio(None)
         self.assertEqual(result, "input/maya.wav")
 
-    @patch("rp_handler.requests.get")
     @patch("rp_handler.os.path.exists")
-    def test_default_audio_download(self, mock_exists, mock_get):
-        mock_exists.return_value = False
+    def test_default_audio_checked_once(self, mock_exists):
+        mock_exists.return_value = True
+        rp_handler.process_reference_audio(None)
+        result = rp_handler.process_reference_audio(None)
+        self.assertEqual(result, "input/maya.wav")
+        mock_exists.assert_called_once_with("input/maya.wav")
+
+    def _default_audio_in_tempdir(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "input", "maya.wav")
+        patcher = patch("rp_handler.DEFAULT_REFERENCE_AUDIO", path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return path
+
+    @patch("rp_handler._SESSION.get")
+    def test_default_audio_download(self, mock_get):
+        path = self._default_audio_in_tempdir()
         mock_response = MagicMock()
-        mock_response.content = b"audio_data"
-        mock_get.return_value = mock_response
+        mock_response.raw = io.BytesIO(b"audio_data")
+        mock_get.return_value.__enter__.return_value = mock_response
 
         result = rp_handler.process_reference_audio(None)
-        self.assertEqual(result, "input/maya.wav")
+        self.assertEqual(result, path)
         mock_get.assert_called_once()
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"audio_data")
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["maya.wav"])
+
+    @patch("rp_handler._SESSION.get")
+    def test_default_audio_download_content_encoding(self, mock_get):
+        path = self._default_audio_in_tempdir()
+        mock_response = MagicMock()
+        mock_response.raw = urllib3.HTTPResponse(
+            body=io.BytesIO(gzip.compress(b"audio_data")),
+            headers={"Content-Encoding": "gzip"},
+            preload_content=False,
+        )
+        mock_get.return_value.__enter__.return_value = mock_response
+
+        rp_handler.process_reference_audio(None)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"audio_data")
+
+    @patch("rp_handler._SESSION.get")
+    def test_default_audio_download_failure_leaves_no_file(self, mock_get):
+        path = self._default_audio_in_tempdir()
+        mock_response = MagicMock()
+        mock_response.raise_for_status.side_effect = Exception("404")
+        mock_get.return_value.__enter__.return_value = mock_response
+
+        with self.assertRaises(Exception):
+            rp_handler.process_reference_audio(None)
+        self.assertEqual(os.listdir(os.path.dirname(path)), [])
 
-    @patch("rp_handler.requests.get")
+    @patch("rp_handler._SESSION.get")
     @patch("rp_handler.tempfile.NamedTemporaryFile")
     def test_url_audio(self, mock_tempfile, mock_get):
         mock_response = MagicMock()
-        mock_response.content = b"audio_data"
-        mock_get.return_value = mock_response
+        mock_response.raw = io.BytesIO(b"audio_data")
+        mock_get.return_value.__enter__.return_value = mock_response
 
         mock_file = MagicMock()
         mock_file.name = "/tmp/test.wav"
@@ -117,7 +185,47 @@ class TestProcessReferenceAudio(unittest.TestCase):
 
         result = rp_handler.process_reference_audio("http://example.com/audio.wav")
         self.assertEqual(result, "/tmp/test.wav")
-        mock_get.assert_called_once_with("http://example.com/audio.wav")
+        mock_tempfile.assert_called_once_with(suffix=".wav", delete=False, dir=rp_handler.REF_AUDIO_TMP_DIR)
+        mock_get.assert_called_once_with(
+            "http://example.com/audio.wav", stream=True, timeout=rp_handler.HTTP_TIMEOUT
+        )
+        mock_file.write.assert_called_once_with(b"audio_data")
+        # The response is released back to the pool
+        mock_get.return_value.__exit__.assert_called_once()
+
+    @patch("rp_handler._SESSION.get")
+    @patch("rp_handler.tempfile.NamedTemporaryFile")
+    def test_url_audio_content_encoding(self, mock_tempfile, mock_get):
+        mock_response = MagicMock()
+        mock_response.raw = urllib3.HTTPResponse(
+            body=io.BytesIO(gzip.compress(b"audio_data")),
+            headers={"Content-Encoding": "gzip"},
+            preload_content=False,
+        )
+        mock_get.return_value.__enter__.return_value = mock_response
+
+        mock_file = MagicMock()
+        mock_file.name = "/tmp/test.wav"
+        mock_tempfile.return_value.__enter__.return_value = mock_file
+
+        rp_handler.process_reference_audio("https://example.com/audio.wav")
+        written = b"".join(c.args[0] for c in mock_file.write.call_args_list)
+        self.assertEqual(written, b"audio_data")
+
+    @patch("rp_handler._SESSION.get")
+    @patch("rp_handler.tempfile.NamedTemporaryFile")
+    def test_url_audio_http_error_closes_response(self, mock_tempfile, mock_get):
+        mock_response = MagicMock()
+        mock_response.raise_for_status.side_effect = Exception("404")
+        mock_get.return_value.__enter__.return_value = mock_response
+
+        mock_file = MagicMock()
+        mock_file.name = "/tmp/test.wav"
+        mock_tempfile.return_value.__enter__.return_value = mock_file
+
+        with patch("rp_handler.os.unlink"), self.assertRaises(Exception):
+            rp_handler.process_reference_audio("https://example.com/audio.wav")
+        mock_get.return_value.__exit__.assert_called_once()
 
     @patch("rp_handler.tempfile.NamedTemporaryFile")
     def test_base64_audio(self, mock_tempfile):
@@ -132,21 +240,159 @@ class TestProcessReferenceAudio(unittest.TestCase):
         self.assertEqual(result, "/tmp/test.wav")
         mock_file.write.assert_called_once_with(audio_data)
 
+    @patch("rp_handler.B64_DECODE_CHUNK_CHARS", 8)
+    @patch("rp_handler.tempfile.NamedTemporaryFile")
+    def test_base64_audio_chunked(self, mock_tempfile):
+        audio_data = b"chunked_test_audio_data"
+        b64_data = base64.b64encode(audio_data).decode()
+
+        mock_file = MagicMock()
+        mock_file.name = "/tmp/test.wav"
+        mock_tempfile.return_value.__enter__.return_value = mock_file
+
+        rp_handler.process_reference_audio(b64_data)
+        self.assertGreater(mock_file.write.call_count, 1)
+        written = b"".join(c.args[0] for c in mock_file.write.call_args_list)
+        self.assertEqual(written, audio_data)
+
+    @patch("rp_handler.B64_DECODE_CHUNK_CHARS", 8)
+    @patch("rp_handler.tempfile.NamedTemporaryFile")
+    def test_base64_audio_line_wrapped(self, mock_tempfile):
+        # MIME-style base64 wraps every 76 characters, which would misalign slices
+        audio_data = bytes(range(256))
+        b64_data = base64.encodebytes(audio_data).decode()
+        self.assertIn("\n", b64_data)
+
+        mock_file = MagicMock()
+        mock_file.name = "/tmp/test.wav"
+        mock_tempfile.return_value.__enter__.return_value = mock_file
+
+        rp_handler.process_reference_audio(b64_data)
+        written = b"".join(c.args[0] for c in mock_file.write.call_args_list)
+        self.assertEqual(written, audio_data)
+
+    @patch("rp_handler._SESSION.get")
+    @patch("rp_handler.tempfile.NamedTemporaryFile")
+    def test_base64_audio_starting_with_http(self, mock_tempfile, mock_get):
+        audio_data = base64.b64decode("httpYXVkaW8=")
+        mock_file = MagicMock()
+        mock_file.name = "/tmp/test.wav"
+        mock_tempfile.return_value.__enter__.return_value = mock_file
+
+        rp_handler.process_reference_audio("httpYXVkaW8=")
+        mock_get.assert_not_called()
+        mock_file.write.assert_called_once_with(audio_data)
+
+    @patch("rp_handler._b64decode", binascii.a2b_base64)
+    @patch("rp_handler.tempfile.NamedTemporaryFile")
+    def test_base64_audio_stdlib_decoder(self, mock_tempfile):
+        audio_data = b"stdlib_test_audio_data"
+        b64_data = base64.b64encode(audio_data).decode()
+
+        mock_file = MagicMock()
+        mock_file.name = "/tmp/test.wav"
+        mock_tempfile.return_value.__enter__.return_value = mock_file
+
+        rp_handler.process_reference_audio(b64_data)
+        mock_file.write.assert_called_once_with(audio_data)
+
     def test_invalid_base64_audio(self):
         with self.assertRaises(ValueError):
             rp_handler.process_reference_audio("invalid_base64!")
 
+    @unittest.skipUnless(rp_handler.base64.__name__ == "pybase64", "pybase64 not installed")
+    def test_base64_audio_rejects_non_alphabet_characters(self):
+        # Lenient decoding would silently drop the "*" and write corrupt audio
+        with self.assertRaises(ValueError):
+            rp_handler.process_reference_audio("dGVz*dA==")
+
+    @patch("rp_handler._b64decode", binascii.a2b_base64)
+    def test_invalid_base64_audio_stdlib_decoder(self):
+        with self.assertRaises(ValueError):
+            rp_handler.process_reference_audio("invalid_base64!")
+
+
+class TestReferenceAudioCache(unittest.TestCase):
+    """Test the on-disk reference audio cache."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = rp_handler.Path(tmp.name) / "refaudio"
+        for patcher in (patch("rp_handler._REF_CACHE_DIR", self.cache_dir),
+                        patch("rp_handler._ref_cache_count", None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_cache_miss_then_hit(self):
+        b64_data = base64.b64encode(b"cached_audio").decode()
+
+        first = rp_handler.process_reference_audio(b64_data)
+        with open(first, "rb") as f:
+            self.assertEqual(f.read(), b"cached_audio")
+
+        with patch("rp_handler._decode_base64_to_file") as mock_decode:
+            second = rp_handler.process_reference_audio(b64_data)
+        self.assertEqual(first, second)
+        mock_decode.assert_not_called()
+
+    def test_invalid_base64_not_cached(self):
+        with self.assertRaises(ValueError):
+            rp_handler.process_reference_audio("invalid_base64!")
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_concurrent_miss_shares_fetch(self):
+        b64_data = base64.b64encode(b"shared_audio").decode()
+        key = rp_handler.hashlib.blake2b(b64_data.encode(), digest_size=16).hexdigest()
+        inflight = rp_handler.concurrent.futures.Future()
+
+        # Another job is already fetching this voice
+        with patch.dict(rp_handler._ref_inflight, {key: inflight}), \
+                patch("rp_handler._write_reference_audio") as mock_write, \
+                rp_handler.concurrent.futures.ThreadPoolExecutor(1) as executor:
+            waiter = executor.submit(rp_handler.process_reference_audio, b64_data)
+            inflight.set_result("/cache/shared.wav")
+            self.assertEqual(waiter.result(timeout=5), "/cache/shared.wav")
+        mock_write.assert_not_called()
+
+    def test_failed_fetch_is_not_shared_afterwards(self):
+        with self.assertRaises(ValueError):
+            rp_handler.process_reference_audio("invalid_base64!")
+        self.assertEqual(rp_handler._ref_inflight, {})
+
+    @patch("rp_handler.REF_CACHE_MAX_ENTRIES", 2)
+    def test_lru_eviction(self):
+        paths = []
+        for i in range(3):
+            path = rp_handler.process_reference_audio(base64.b64encode(b"audio%d" % i).decode())
+            os.utime(path, (i, i))
+            paths.append(path)
+
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
+
+    @patch("rp_handler.REF_CACHE_MAX_ENTRIES", 2)
+    def test_directory_scanned_only_to_evict(self):
+        with patch("rp_handler._scan_reference_cache",
+                   wraps=rp_handler._scan_reference_cache) as mock_scan:
+            for i in range(2):
+                rp_handler.process_reference_audio(base64.b64encode(b"audio%d" % i).decode())
+            # Counted once on the first fill, then tracked in memory
+            self.assertEqual(mock_scan.call_count, 1)
+
+            rp_handler.process_reference_audio(base64.b64encode(b"audio2").decode())
+            self.assertEqual(mock_scan.call_count, 2)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
 
 class TestModifyWorkflow(unittest.TestCase):
     """Test workflow modification."""
 
-    @patch("builtins.open", new_callable=mock_open, read_data='{"nodes": [{}, {}, {}, {}, {}]}')
-    def test_modify_workflow(self, mock_file):
+    @patch("rp_handler._WORKFLOW_TEMPLATE", {"nodes": [{"widgets_values": [None]} for _ in range(5)]})
+    def test_modify_workflow(self):
         workflow = rp_handler.modify_workflow("Test text", "/path/to/audio.wav", 0.9, 1.2, 123)
 
-        # Verify the workflow was loaded
-        mock_file.assert_called_once_with("workflows/vibevoice_tts.json", "r")
-
         # Check that nodes were modified
         self.assertEqual(workflow["nodes"][0]["widgets_values"][0], "Test text")
         self.assertEqual(workflow["nodes"][1]["widgets_values"][0], "/path/to/audio.wav")
@@ -154,39 +400,243 @@ class TestModifyWorkflow(unittest.TestCase):
         self.assertEqual(workflow["nodes"][3]["widgets_values"][0], 1.2)
         self.assertEqual(workflow["nodes"][4]["widgets_values"][0], 123)
 
+    def test_modify_workflow_leaves_template_untouched(self):
+        template = json.dumps(rp_handler._WORKFLOW_TEMPLATE)
+
+        workflow = rp_handler.modify_workflow("Test text", "/path/to/audio.wav", 0.9, 1.2, 123)
+
+        self.assertEqual(workflow["nodes"][0]["widgets_values"][0], "Test text")
+        self.assertEqual(json.dumps(rp_handler._WORKFLOW_TEMPLATE), template)
+
+    @patch("rp_handler._WORKFLOW_TEMPLATE", {
+        "nodes": [{"id": i, "widgets_values": [None, "keep"]} for i in range(6)],
+        "links": [[1, 0, 0, 1, 0]]
+    })
+    def test_modify_workflow_shares_untouched_structure(self):
+        template = rp_handler._WORKFLOW_TEMPLATE
+
+        workflow = rp_handler.modify_workflow("Test text", "/path/to/audio.wav", 0.9, 1.2, 123)
+
+        self.assertEqual(workflow["nodes"][0], {"id": 0, "widgets_values": ["Test text", "keep"]})
+        self.assertIs(workflow["nodes"][5], template["nodes"][5])
+        self.assertIs(workflow["links"], template["links"])
+        self.assertEqual(template["nodes"][0]["widgets_values"], [None, "keep"])
+
 
-class TestExecuteWorkflow(unittest.TestCase):
+class FakeComfyWebSocket:
+    """Scripted stand-in for the ComfyUI websocket.
+
+    Each prompt queued over HTTP is answered with the next scripted list of
+    frames, with the prompt's id filled into the frame data. Bytes frames and
+    exceptions are delivered as they are.
+    """
+
+    def __init__(self, *scripts):
+        self.scripts = list(scripts)
+        self.queued = []
+        self.frames = asyncio.Queue()
+        self.loop = asyncio.get_running_loop()
+
+    def queue_prompt(self, workflow, prompt_id):
+        # Stands in for _queue_prompt, which runs in a worker thread
+        self.queued.append((workflow, prompt_id))
+        for frame in self.scripts.pop(0):
+            if isinstance(frame, dict):
+                data = dict(frame.get("data", {}), prompt_id=prompt_id)
+                frame = json.dumps(dict(frame, data=data))
+            self.loop.call_soon_threadsafe(self.frames.put_nowait, frame)
+
+    async def recv(self):
+        frame = await self.frames.get()
+        if isinstance(frame, Exception):
+            raise frame
+        return frame
+
+
+SUCCESS = {"type": "execution_success"}
+
+
+class TestExecuteWorkflow(unittest.IsolatedAsyncioTestCase):
     """Test workflow execution via websockets."""
 
-    @patch("rp_handler.websockets.connect")
-    async def test_execute_workflow_success(self, mock_connect):
-        # Mock websocket context manager
-        mock_websocket = MagicMock()
-        mock_connect.return_value.__aenter__.return_value = mock_websocket
-
-        # Mock successful execution
-        mock_websocket.recv.side_effect = [
-            json.dumps({"type": "execution_cached"}),
-            json.dumps({"type": "execution_success"})
+    def setUp(self):
+        # Fresh connection state bound to this test's event loop
+        patchers = [
+            patch("rp_handler._channel", None),
+            patch("rp_handler._channel_lock", asyncio.Lock()),
+            patch("rp_handler._prompt_slots", asyncio.Semaphore(rp_handler.MAX_CONCURRENT_PROMPTS)),
+            patch("rp_handler._queue_prompt", side_effect=self._queue_prompt),
         ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _queue_prompt(self, workflow, prompt_id):
+        rp_handler._channel.websocket.queue_prompt(workflow, prompt_id)
+
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_execute_workflow_success(self, mock_connect):
+        mock_connect.return_value = FakeComfyWebSocket(
+            [{"type": "execution_cached"}, SUCCESS]
+        )
 
         result = await rp_handler.execute_workflow({"test": "workflow"})
         self.assertEqual(result, "output/vibevoice_output.wav")
 
-    @patch("rp_handler.websockets.connect")
-    async def test_execute_workflow_error(self, mock_connect):
-        mock_websocket = MagicMock()
-        mock_connect.return_value.__aenter__.return_value = mock_websocket
+        workflow, _ = mock_connect.return_value.queued[0]
+        self.assertEqual(workflow, {"test": "workflow"})
+
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_execute_workflow_skips_progress_frames(self, mock_connect):
+        mock_connect.return_value = FakeComfyWebSocket([
+            {"type": "execution_cached", "data": {"nodes": ["1"]}},
+            {"type": "progress", "data": {"value": 1, "max": 10}},
+            {"type": "executing", "data": {"node": "7"}},
+            SUCCESS
+        ])
+
+        with patch("rp_handler.orjson.loads", wraps=rp_handler.orjson.loads) as mock_loads:
+            result = await rp_handler.execute_workflow({"test": "workflow"})
+        self.assertEqual(result, "output/vibevoice_output.wav")
+        mock_loads.assert_called_once()
+
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_execute_workflow_skips_binary_frames(self, mock_connect):
+        mock_connect.return_value = FakeComfyWebSocket([
+            b"\x00\x00\x00\x01\x00\x00\x00\x02\x89PNG",
+            {"type": "progress", "data": {"value": 1, "max": 10}},
+            b"\x00\x00\x00\x01\x00\x00\x00\x02\x89PNG",
+            SUCCESS
+        ])
+
+        result = await rp_handler.execute_workflow({"test": "workflow"})
+        self.assertEqual(result, "output/vibevoice_output.wav")
+        self.assertFalse(rp_handler._channel.closed)
+        _, kwargs = mock_connect.call_args
+        self.assertEqual(kwargs["max_size"], rp_handler.COMFY_WS_MAX_FRAME_BYTES)
+        self.assertIsNone(kwargs["compression"])
+
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_execute_workflow_reuses_connection(self, mock_connect):
+        mock_connect.return_value = FakeComfyWebSocket([SUCCESS], [SUCCESS])
+
+        await rp_handler.execute_workflow({"test": "workflow"})
+        await rp_handler.execute_workflow({"test": "workflow"})
+        mock_connect.assert_awaited_once()
+
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_execute_workflow_concurrent_prompts(self, mock_connect):
+        mock_connect.return_value = FakeComfyWebSocket(
+            [{"type": "execution_error", "data": {"message": "Test error"}}],
+            [SUCCESS]
+        )
+
+        results = await asyncio.gather(
+            rp_handler.execute_workflow({"test": "first"}),
+            rp_handler.execute_workflow({"test": "second"}),
+            return_exceptions=True
+        )
+        # Queue calls run in worker threads, so either prompt may get either script
+        self.assertEqual(sum(isinstance(r, Exception) for r in results), 1)
+        self.assertIn("output/vibevoice_output.wav", results)
+        mock_connect.assert_awaited_once()
+
+    async def test_channel_routes_results_by_prompt_id(self):
+        websocket = MagicMock()
+        websocket.recv = AsyncMock(side_effect=[
+            json.dumps({"type": "execution_success", "data": {"prompt_id": "b"}}),
+            json.dumps({"type": "execution_success", "data": {"prompt_id": "a"}}),
+        ])
+        channel = rp_handler._PromptChannel(websocket)
+
+        first = channel.expect("a")
+        second = channel.expect("b")
+
+        self.assertEqual((await first)["data"]["prompt_id"], "a")
+        self.assertEqual((await second)["data"]["prompt_id"], "b")
+
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_execute_workflow_queue_rejected(self, mock_connect):
+        mock_connect.return_value = FakeComfyWebSocket()
+
+        with patch("rp_handler._queue_prompt", side_effect=ValueError("bad node")):
+            with self.assertRaises(Exception) as context:
+                await rp_handler.execute_workflow({"test": "workflow"})
+        self.assertIn("bad node", str(context.exception))
+        self.assertEqual(rp_handler._channel.pending, {})
+
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_execute_workflow_connection_lost(self, mock_connect):
+        dropped = FakeComfyWebSocket([rp_handler.websockets.ConnectionClosed(None, None)])
+        fresh = FakeComfyWebSocket([SUCCESS])
+        mock_connect.side_effect = [dropped, fresh]
+
+        with self.assertRaises(Exception):
+            await rp_handler.execute_workflow({"test": "workflow"})
+
+        # The next request opens a new connection
+        result = await rp_handler.execute_workflow({"test": "workflow"})
+        self.assertEqual(result, "output/vibevoice_output.wav")
+        self.assertEqual(mock_connect.await_count, 2)
 
-        mock_websocket.recv.return_value = json.dumps({
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_execute_workflow_error(self, mock_connect):
+        mock_connect.return_value = FakeComfyWebSocket([{
             "type": "execution_error",
             "data": {"message": "Test error"}
-        })
+        }])
 
         with self.assertRaises(Exception):
             await rp_handler.execute_workflow({"test": "workflow"})
 
-    @patch("rp_handler.websockets.connect")
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_execute_workflow_exception_message(self, mock_connect):
+        mock_connect.return_value = FakeComfyWebSocket([{
+            "type": "execution_error",
+            "data": {"node_id": "3", "exception_message": "CUDA out of memory"}
+        }])
+
+        with self.assertRaises(Exception) as context:
+            await rp_handler.execute_workflow({"test": "workflow"})
+        self.assertIn("CUDA out of memory", str(context.exception))
+
+    @patch("rp_handler.COMFY_WARMUP_RETRY_DELAY", 0)
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_preconnect_opens_shared_channel(self, mock_connect):
+        mock_connect.return_value = FakeComfyWebSocket()
+
+        await rp_handler._preconnect()
+        self.assertIsNotNone(rp_handler._channel)
+        mock_connect.assert_awaited_once()
+
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_preconnect_ignores_connection_errors(self, mock_connect):
+        mock_connect.side_effect = OSError("Connection refused")
+
+        await rp_handler._preconnect()
+        self.assertIsNone(rp_handler._channel)
+
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_warmup_retries_until_comfyui_accepts(self, mock_connect):
+        websocket = FakeComfyWebSocket([SUCCESS])
+        mock_connect.side_effect = [ConnectionRefusedError(), ConnectionRefusedError(), websocket]
+
+        await rp_handler._warmup()
+        self.assertIs(rp_handler._channel.websocket, websocket)
+
+        # The request reuses the warmed-up connection
+        await rp_handler.execute_workflow({"test": "workflow"})
+        self.assertEqual(mock_connect.await_count, 3)
+
+    @patch("rp_handler.COMFY_WARMUP_TIMEOUT", 0)
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
+    async def test_warmup_gives_up_after_timeout(self, mock_connect):
+        mock_connect.side_effect = ConnectionRefusedError()
+
+        await rp_handler._warmup()
+        self.assertIsNone(rp_handler._channel)
+
+    @patch("rp_handler.websockets.connect", new_callable=AsyncMock)
     async def test_execute_workflow_websocket_error(self, mock_connect):
         mock_connect.side_effect = Exception("Connection failed")
 
@@ -194,36 +644,189 @@ class TestExecuteWorkflow(unittest.TestCase):
             await rp_handler.execute_workflow({"test": "workflow"})
 
 
+class TestQueuePrompt(unittest.TestCase):
+    """Test queueing prompts over ComfyUI's REST API."""
+
+    @patch("rp_handler._SESSION.post")
+    def test_queue_prompt(self, mock_post):
+        mock_post.return_value.status_code = 200
+
+        rp_handler._queue_prompt({"test": "workflow"}, "abc")
+
+        url = mock_post.call_args.args[0]
+        self.assertEqual(url, f"http://{rp_handler.COMFY_HOST}/prompt")
+        payload = json.loads(mock_post.call_args.kwargs["data"])
+        self.assertEqual(payload, {
+            "prompt": {"test": "workflow"},
+            "client_id": rp_handler.CLIENT_ID,
+            "prompt_id": "abc"
+        })
+        self.assertEqual(mock_post.call_args.kwargs["timeout"], rp_handler.HTTP_TIMEOUT)
+
+    @patch("rp_handler._SESSION.post")
+    def test_queue_prompt_rejected(self, mock_post):
+        mock_post.return_value.status_code = 400
+        mock_post.return_value.text = '{"error": "invalid prompt"}'
+
+        with self.assertRaises(ValueError) as context:
+            rp_handler._queue_prompt({"test": "workflow"}, "abc")
+        self.assertIn("invalid prompt", str(context.exception))
+
+
 class TestGetAudioOutput(unittest.TestCase):
     """Test audio output processing."""
 
-    @patch("rp_handler.torchaudio.load")
-    @patch("builtins.open", new_callable=mock_open, read_data=b"audio_data")
-    def test_get_audio_output(self, mock_file, mock_load):
-        # Mock torchaudio
-        mock_waveform = MagicMock()
-        mock_waveform.shape = [1, 44100]  # 1 second at 44100 Hz
-        mock_load.return_value = (mock_waveform, 44100)
+    def _write_wav(self, sample_rate, num_frames, channels=1):
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(b"\x00" * (num_frames * channels * 2))
+
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+            f.write(buf.getvalue())
+        self.addCleanup(os.unlink, f.name)
+        return f.name, buf.getvalue()
 
-        result = rp_handler.get_audio_output("/path/to/audio.wav", 123)
+    def test_get_audio_output(self):
+        path, wav_data = self._write_wav(44100, 44100)  # 1 second at 44100 Hz
 
-        expected_b64 = base64.b64encode(b"audio_data").decode()
+        result = rp_handler.get_audio_output(path, 123)
+
+        expected_b64 = base64.b64encode(wav_data).decode()
         self.assertEqual(result["audio_base64"], expected_b64)
         self.assertEqual(result["duration"], 1.0)
         self.assertEqual(result["sample_rate"], 44100)
         self.assertEqual(result["seed_used"], 123)
 
-    @patch("rp_handler.torchaudio.load")
-    def test_get_audio_output_error(self, mock_load):
-        mock_load.side_effect = Exception("Load failed")
+    def test_get_audio_output_stereo(self):
+        path, _ = self._write_wav(24000, 12000, channels=2)
+
+        result = rp_handler.get_audio_output(path, 123)
+        self.assertEqual(result["duration"], 0.5)
+        self.assertEqual(result["sample_rate"], 24000)
 
+    def test_get_audio_output_error(self):
         with self.assertRaises(Exception):
             rp_handler.get_audio_output("/path/to/audio.wav", 123)
 
+    def test_get_audio_output_invalid_wav(self):
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+            f.write(b"This is not a valid WAV file")
+        self.addCleanup(os.unlink, f.name)
+
+        with self.assertRaises(Exception):
+            rp_handler.get_audio_output(f.name, 123)
+
+    @patch("rp_handler.sf")
+    def test_get_audio_output_non_wav_container(self, mock_sf):
+        with tempfile.NamedTemporaryFile(suffix=".flac", delete=False) as f:
+            f.write(b"fLaC" + b"\x00" * 60)
+        self.addCleanup(os.unlink, f.name)
+        mock_sf.info.return_value = SimpleNamespace(samplerate=24000, frames=48000)
+
+        result = rp_handler.get_audio_output(f.name, 123)
+        mock_sf.info.assert_called_once_with(f.name)
+        self.assertEqual(result["duration"], 2.0)
+        self.assertEqual(result["sample_rate"], 24000)
+
+    @patch("rp_handler.sf")
+    def test_get_audio_output_truncated_fmt_chunk(self, mock_sf):
+        # The fmt chunk header is present but its body is cut short
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+            f.write(b"RIFF\x24\x00\x00\x00WAVEfmt \x10\x00\x00\x00\x01\x00")
+        self.addCleanup(os.unlink, f.name)
+        mock_sf.info.return_value = SimpleNamespace(samplerate=24000, frames=24000)
+
+        result = rp_handler.get_audio_output(f.name, 123)
+        mock_sf.info.assert_called_once_with(f.name)
+        self.assertEqual(result["duration"], 1.0)
+
+
+class TestAudioUrlOutput(unittest.TestCase):
+    """Test returning output audio as a presigned URL."""
+
+    def setUp(self):
+        patcher = patch("rp_handler._s3", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _write_wav(self):
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(24000)
+            wav.writeframes(b"\x00" * 48000)
+
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+            f.write(buf.getvalue())
+        self.addCleanup(os.unlink, f.name)
+        return f.name, buf.getvalue()
+
+    @patch("runpod.serverless.utils.rp_upload.get_boto_client")
+    @patch("rp_handler.BUCKET_NAME", "bucket")
+    def test_get_audio_output_url(self, mock_get_client):
+        client = MagicMock()
+        client.generate_presigned_url.return_value = "https://bucket.example/job/audio.wav"
+        uploaded = []
+        client.upload_fileobj.side_effect = lambda f, *args, **kwargs: uploaded.append(f.read())
+        mock_get_client.return_value = (client, "transfer-config")
+        path, wav_data = self._write_wav()
+
+        result = rp_handler.get_audio_output(path, 7, "url", "job-1")
+
+        self.assertEqual(result["audio_url"], "https://bucket.example/job/audio.wav")
+        self.assertNotIn("audio_base64", result)
+        self.assertEqual(result["duration"], 1.0)
+        self.assertEqual(result["seed_used"], 7)
+        self.assertEqual(uploaded, [wav_data])
+
+        _, bucket, key = client.upload_fileobj.call_args.args
+        self.assertEqual(bucket, "bucket")
+        self.assertTrue(key.startswith("job-1/"))
+        self.assertEqual(client.upload_fileobj.call_args.kwargs["Config"], "transfer-config")
+
+    @patch("runpod.serverless.utils.rp_upload.get_boto_client")
+    @patch("rp_handler.BUCKET_NAME", None)
+    def test_default_bucket_follows_the_month(self, mock_get_client):
+        client = MagicMock()
+        mock_get_client.return_value = (client, None)
+        path, _ = self._write_wav()
+
+        with patch("rp_handler.time.strftime", side_effect=["10-26", "11-26"]):
+            rp_handler.get_audio_output(path, 7, "url")
+            rp_handler.get_audio_output(path, 7, "url")
+        buckets = [c.args[1] for c in client.upload_fileobj.call_args_list]
+        self.assertEqual(buckets, ["10-26", "11-26"])
+
+    @patch("runpod.serverless.utils.rp_upload.get_boto_client")
+    def test_s3_client_is_shared(self, mock_get_client):
+        mock_get_client.return_value = (MagicMock(), None)
+
+        self.assertIs(rp_handler._get_s3_client(), rp_handler._get_s3_client())
+        mock_get_client.assert_called_once()
+
+    @patch("runpod.serverless.utils.rp_upload.get_boto_client")
+    def test_get_audio_output_url_not_configured(self, mock_get_client):
+        mock_get_client.return_value = (None, None)
+        path, _ = self._write_wav()
+
+        with self.assertRaises(Exception) as context:
+            rp_handler.get_audio_output(path, 7, "url")
+        self.assertIn("BUCKET_ENDPOINT_URL", str(context.exception))
+
 
 class TestHandler(unittest.TestCase):
     """Test main handler function."""
 
+    def setUp(self):
+        # Keep the handler off the network: no early ComfyUI connection
+        patcher = patch("rp_handler._preconnect", new_callable=AsyncMock)
+        self.mock_preconnect = patcher.start()
+        self.addCleanup(patcher.stop)
+
     @patch("rp_handler.process_reference_audio")
     @patch("rp_handler.modify_workflow")
     @patch("rp_handler.execute_workflow")
@@ -250,6 +853,28 @@ class TestHandler(unittest.TestCase):
         self.assertEqual(result["duration"], 2.0)
         mock_process_audio.assert_called_once_with(None)
         mock_modify.assert_called_once_with("Hello world", "/path/to/audio.wav", 0.9, 1.2, 456)
+        mock_get_output.assert_called_once_with("/output/audio.wav", 456, "base64", None)
+        self.mock_preconnect.assert_awaited_once()
+
+    @patch("rp_handler.process_reference_audio")
+    @patch("rp_handler.modify_workflow")
+    @patch("rp_handler.execute_workflow")
+    @patch("rp_handler.get_audio_output")
+    def test_handler_async_runs_on_shared_loop(self, mock_get_output, mock_execute, mock_modify, mock_process_audio):
+        mock_process_audio.return_value = "/path/to/audio.wav"
+        mock_get_output.return_value = {"audio_base64": "b64data"}
+        loops = []
+
+        async def execute(workflow):
+            loops.append(asyncio.get_running_loop())
+            return "/output/audio.wav"
+
+        mock_execute.side_effect = execute
+
+        # Awaited from a caller-owned loop, the request still runs on _loop
+        result = asyncio.run(rp_handler.handler_async({"input": {"text": "Hello"}}))
+        self.assertEqual(result, {"audio_base64": "b64data"})
+        self.assertEqual(loops, [rp_handler._loop])
 
     @patch("rp_handler.process_reference_audio")
     def test_handler_validation_error(self, mock_process_audio):
@@ -287,7 +912,58 @@ class TestHandler(unittest.TestCase):
 
         rp_handler.handler(event)
 
-        # Should attempt to cleanup temp file
+        # Should attempt to cleanup temp file, off the response path
+        rp_handler._cleanup_queue.join()
+        mock_unlink.assert_called_once_with("/tmp/temp_audio.wav")
+
+    @patch("rp_handler.REF_AUDIO_TMP_DIR", "/dev/shm")
+    @patch("rp_handler.os.unlink")
+    @patch("rp_handler.process_reference_audio")
+    @patch("rp_handler.modify_workflow")
+    @patch("rp_handler.execute_workflow")
+    @patch("rp_handler.get_audio_output")
+    def test_handler_tmpfs_file_cleanup(self, mock_get_output, mock_execute, mock_modify, mock_process_audio, mock_unlink):
+        mock_process_audio.return_value = "/dev/shm/temp_audio.wav"
+        mock_modify.return_value = {"workflow": "data"}
+        mock_execute.return_value = "/output/audio.wav"
+        mock_get_output.return_value = {"audio": "data"}
+
+        rp_handler.handler({"input": {"text": "Hello"}})
+
+        rp_handler._cleanup_queue.join()
+        mock_unlink.assert_called_once_with("/dev/shm/temp_audio.wav")
+
+    @patch("rp_handler._REF_CACHE_DIR", rp_handler.Path("/tmp/refaudio"))
+    @patch("rp_handler.os.unlink")
+    @patch("rp_handler.process_reference_audio")
+    @patch("rp_handler.modify_workflow")
+    @patch("rp_handler.execute_workflow")
+    @patch("rp_handler.get_audio_output")
+    def test_handler_keeps_cached_reference(self, mock_get_output, mock_execute, mock_modify, mock_process_audio, mock_unlink):
+        mock_process_audio.return_value = "/tmp/refaudio/0123abcd.wav"
+        mock_modify.return_value = {"workflow": "data"}
+        mock_execute.return_value = "/output/audio.wav"
+        mock_get_output.return_value = {"audio": "data"}
+
+        rp_handler.handler({"input": {"text": "Hello"}})
+
+        rp_handler._cleanup_queue.join()
+        mock_unlink.assert_not_called()
+
+    @patch("rp_handler.os.unlink")
+    @patch("rp_handler.process_reference_audio")
+    @patch("rp_handler.modify_workflow")
+    @patch("rp_handler.execute_workflow")
+    def test_handler_temp_file_cleanup_on_error(self, mock_execute, mock_modify, mock_process_audio, mock_unlink):
+        mock_process_audio.return_value = "/tmp/temp_audio.wav"
+        mock_modify.return_value = {"workflow": "data"}
+        mock_execute.side_effect = Exception("Execution failed")
+        mock_unlink.side_effect = FileNotFoundError
+
+        result = rp_handler.handler({"input": {"text": "Hello"}})
+
+        self.assertIn("Execution failed", result["error"])
+        rp_handler._cleanup_queue.join()
         mock_unlink.assert_called_once_with("/tmp/temp_audio.wav")
 
 